@@ -0,0 +1,81 @@
+"""add location identity key
+
+Revision ID: 2c249a1a9cb6
+Revises: 113427609c1e
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+import hashlib
+from typing import Dict, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '2c249a1a9cb6'
+down_revision: Union[str, None] = '113427609c1e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _identity_key(city: str, state: str, country: str, lat: float, lon: float) -> str:
+    # Frozen copy of app.services.locations.location_identity
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    identity = "|".join((
+        normalize(country),
+        normalize(state),
+        normalize(city),
+        f"{round(lat, 5) + 0.0:.5f}",
+        f"{round(lon, 5) + 0.0:.5f}",
+    ))
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def upgrade() -> None:
+    op.add_column('locations', sa.Column('identity_key', sa.String(length=64), nullable=True))
+
+    # Backfill, merging locations that share an identity into the oldest row
+    bind = op.get_bind()
+    locations = sa.table(
+        'locations',
+        sa.column('id', sa.Integer),
+        sa.column('city', sa.String),
+        sa.column('state', sa.String),
+        sa.column('country', sa.String),
+        sa.column('latitude', sa.Float),
+        sa.column('longitude', sa.Float),
+        sa.column('identity_key', sa.String),
+    )
+    reports = sa.table(
+        'air_quality_reports',
+        sa.column('location_id', sa.Integer),
+    )
+    kept: Dict[str, int] = {}
+    rows = bind.execute(sa.select(
+        locations.c.id,
+        locations.c.city,
+        locations.c.state,
+        locations.c.country,
+        locations.c.latitude,
+        locations.c.longitude,
+    ).order_by(locations.c.id)).all()
+    for row in rows:
+        key = _identity_key(row.city, row.state, row.country, row.latitude, row.longitude)
+        if key in kept:
+            bind.execute(reports.update().where(reports.c.location_id == row.id).values(location_id=kept[key]))
+            bind.execute(locations.delete().where(locations.c.id == row.id))
+        else:
+            kept[key] = row.id
+            bind.execute(locations.update().where(locations.c.id == row.id).values(identity_key=key))
+
+    with op.batch_alter_table('locations') as batch_op:
+        batch_op.alter_column('identity_key', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_unique_constraint('uq_locations_identity_key', ['identity_key'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('locations') as batch_op:
+        batch_op.drop_constraint('uq_locations_identity_key', type_='unique')
+        batch_op.drop_column('identity_key')
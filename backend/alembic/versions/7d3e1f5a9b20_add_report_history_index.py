@@ -0,0 +1,33 @@
+"""add report history index
+
+Revision ID: 7d3e1f5a9b20
+Revises: 2c249a1a9cb6
+Create Date: 2026-10-18 11:40:07.815390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3e1f5a9b20'
+down_revision: Union[str, None] = '2c249a1a9cb6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_air_quality_reports_user_id_timestamp_id',
+        'air_quality_reports',
+        ['user_id', 'timestamp', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    # MySQL drops its implicit foreign key index on user_id once this one can
+    # stand in for it, and refuses to drop this one without a replacement
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_index('ix_air_quality_reports_user_id', 'air_quality_reports', ['user_id'], unique=False)
+    op.drop_index('ix_air_quality_reports_user_id_timestamp_id', table_name='air_quality_reports')
@@ -1,9 +1,17 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.deps import get_db, get_current_user
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import uuid
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.deps import get_async_db, get_current_user
+from app.core.pagination import decode_cursor, encode_cursor
 from app.services.air_quality_service import AirQualityService
-from app.models.models import User, AirQualityReport
+from app.api.api_v1.endpoints.websocket import manager
+from app.websockets.sse import create_sse_sender
+from app.models.models import User, AirQualityReport, Location
 from pydantic import BaseModel, Field
 
 router = APIRouter()
@@ -16,6 +24,24 @@ class AirQualityRequest(BaseModel):
     latitude: float = Field(..., ge=-90, le=90)
     longitude: float = Field(..., ge=-180, le=180)
 
+class Coordinate(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class BatchAirQualityRequest(BaseModel):
+    locations: List[Coordinate] = Field(
+        ..., min_items=1, max_items=settings.AIR_QUALITY_BATCH_MAX_ITEMS
+    )
+
+class BatchAirQualityItem(BaseModel):
+    latitude: float
+    longitude: float
+    data: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+class BatchAirQualityResponse(BaseModel):
+    results: List[BatchAirQualityItem]
+
 class AirQualityResponse(BaseModel):
     id: int
     aqi: float
@@ -28,15 +54,29 @@ class AirQualityResponse(BaseModel):
     city: str
     state: str
     country: str
-    timestamp: str
+    timestamp: datetime
 
-    class Config:
-        orm_mode = True
+def report_response(report: AirQualityReport, city: str, state: str, country: str) -> AirQualityResponse:
+    """A report plus the place it was taken, which lives on its Location"""
+    return AirQualityResponse(
+        id=report.id,
+        aqi=report.aqi,
+        pm25=report.pm25,
+        pm10=report.pm10,
+        o3=report.o3,
+        no2=report.no2,
+        so2=report.so2,
+        co=report.co,
+        city=city,
+        state=state,
+        country=country,
+        timestamp=report.timestamp,
+    )
 
 @router.post("/reports", response_model=AirQualityResponse)
 async def create_air_quality_report(
     request: AirQualityRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new air quality report"""
@@ -56,31 +96,55 @@ async def create_air_quality_report(
             detail="Failed to create air quality report"
         )
     
-    return report
+    return report_response(report, request.city, request.state, request.country)
 
 @router.get("/reports", response_model=List[AirQualityResponse])
 async def get_air_quality_reports(
+    response: Response,
     skip: int = 0,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get air quality reports for the current user"""
-    reports = (
-        db.query(AirQualityReport)
-        .filter(AirQualityReport.user_id == current_user.id)
-        .order_by(AirQualityReport.timestamp.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    """
+    Get air quality reports for the current user, newest first. When there
+    are more, the X-Next-Cursor header holds a cursor for the next page;
+    passing it back as `cursor` seeks straight to it on the
+    (user_id, timestamp, id) index, so deep pages cost the same as the
+    first. `skip` still works but scans every skipped row.
+    """
+    query = (
+        select(AirQualityReport, Location.city, Location.state, Location.country)
+        .join(Location, AirQualityReport.location_id == Location.id)
+        .where(AirQualityReport.user_id == current_user.id)
+        .order_by(AirQualityReport.timestamp.desc(), AirQualityReport.id.desc())
     )
-    return reports
+    if cursor is not None:
+        try:
+            timestamp, last_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(or_(
+            AirQualityReport.timestamp < timestamp,
+            and_(AirQualityReport.timestamp == timestamp, AirQualityReport.id < last_id),
+        ))
+    else:
+        query = query.offset(skip)
+    # One extra row tells whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.timestamp, last.id)
+    return [report_response(*row) for row in rows]
 
-@router.get("/reports/latest", response_model=AirQualityResponse)
+@router.get("/reports/latest")
 async def get_latest_air_quality(
-    latitude: float = Field(..., ge=-90, le=90),
-    longitude: float = Field(..., ge=-180, le=180),
-    db: Session = Depends(get_db),
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get latest air quality data for a location"""
@@ -91,3 +155,52 @@ async def get_latest_air_quality(
             detail="Failed to fetch air quality data"
         )
     return data
+
+@router.post("/batch", response_model=BatchAirQualityResponse)
+async def get_air_quality_batch(
+    request: BatchAirQualityRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Get latest air quality data for many locations in one request"""
+    results = await air_quality_service.get_air_quality_batch(
+        [(location.latitude, location.longitude) for location in request.locations]
+    )
+    return {"results": results}
+
+@router.get("/stream")
+async def stream_air_quality(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    deltas: bool = False,
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-Sent Events stream of air quality updates for a location, fed by
+    the same location hub as /api/v1/ws/air-quality: full frames, or a snapshot
+    then deltas with `deltas=true`.
+    Reconnecting with Last-Event-ID skips the snapshot if nothing changed.
+    """
+    client_id = uuid.uuid4().hex
+
+    async def events():
+        # Set up only once the body is being sent, so a client that goes away
+        # before then (or a failed subscribe) leaves nothing behind
+        sender = create_sse_sender()
+        if deltas:
+            # A delta client that overflows its queue is sent a snapshot instead
+            sender.resync = lambda: manager.snapshot(client_id)
+        try:
+            manager.register(client_id, sender, deltas=deltas)
+            await manager.subscribe(client_id, latitude, longitude, last_event_id=last_event_id)
+            async for event in sender.events(retry=settings.WS_RETRY_INTERVAL):
+                yield event
+        finally:
+            manager.disconnect(client_id)
+            sender.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,120 +1,303 @@
 from fastapi import APIRouter, WebSocket, Depends, HTTPException, WebSocketDisconnect, Query
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Set, Tuple
 from app.services.air_quality import get_air_quality_data, AirQualityService
+from app.services.spatial import SpatialGrid, air_quality_grid
+from app.services.scheduler import RefreshScheduler, refresh_scheduler
+from app.services.broadcast_bus import BroadcastBus, broadcast_bus
+from app.services.leases import LeaseStore, location_lease_ttl, location_leases
+from app.services.adaptive_interval import AdaptiveIntervals, refresh_intervals
+from app.services.aqi import calculate_aqi
+from app.core.config import settings
 from app.core.auth import get_current_user_ws
+from app.websockets.deltas import DeltaEncoder, create_delta_encoder
+from app.websockets.encoding import encode_frame
+from app.websockets.sender import create_sender
 from datetime import datetime
-import asyncio
 import logging
 import json
+import uuid
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 class ConnectionManager:
-    def __init__(self):
+    """
+    Tracks push clients (WebSockets and SSE streams) and groups them by
+    (quantized) location. Each location has one refresh job on the shared
+    scheduler whose result goes to all its subscribers; subscriptions are refcounted and
+    the job is cancelled with the last one. Every message to a client
+    goes through its bounded send queue; broadcasts are encoded once and
+    the same frame is queued for every subscriber. Updates are change-only
+    (see `DeltaEncoder`): clients that opt in get a snapshot, then deltas;
+    the rest get a full frame for every change.
+
+    With several workers, only the holder of a location's lease polls it
+    and publishes the reading on the broadcast bus; every worker (itself
+    included) turns bus messages into frames for its own subscribers.
+    """
+
+    topic = "ws"
+
+    def __init__(
+        self,
+        grid: Optional[SpatialGrid] = None,
+        scheduler: Optional[RefreshScheduler] = None,
+        deltas: Optional[DeltaEncoder] = None,
+        bus: Optional[BroadcastBus] = None,
+        leases: Optional[LeaseStore] = None,
+        intervals: Optional[AdaptiveIntervals] = None,
+    ):
         self.active_connections: Dict[str, Dict[str, Any]] = {}
+        self.subscriptions: Dict[str, Set[str]] = {}
+        self.deltas = deltas if deltas is not None else create_delta_encoder()
         self.air_quality_service = AirQualityService()
+        self.grid = grid if grid is not None else air_quality_grid
+        self.scheduler = scheduler if scheduler is not None else refresh_scheduler
+        self.leases = leases if leases is not None else location_leases
+        self.intervals = intervals if intervals is not None else refresh_intervals
+        self.bus = bus if bus is not None else broadcast_bus
+        self.bus.subscribe(self.topic, self._on_bus_message)
+
+    def _job_key(self, location_key: str) -> str:
+        return f"ws:{location_key}"
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, deltas: bool = False):
         await websocket.accept()
+        self.register(
+            client_id, create_sender(websocket, on_close=lambda: self.disconnect(client_id)), websocket, deltas
+        )
+
+    def register(self, client_id: str, sender: Any, websocket: Optional[WebSocket] = None, deltas: bool = False):
+        """
+        Add a client with any sender (WebSocket or SSE) that has `enqueue`
+        and `close`. Only clients that asked for `deltas` (and can resync
+        from a snapshot) get delta frames.
+        """
         self.active_connections[client_id] = {
             'websocket': websocket,
-            'update_task': None
+            'sender': sender,
+            'location': None,
+            'deltas': deltas and self.deltas.deltas,
         }
 
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
-            if self.active_connections[client_id]['update_task']:
-                self.active_connections[client_id]['update_task'].cancel()
-            del self.active_connections[client_id]
+            self.unsubscribe(client_id)
+            self.active_connections.pop(client_id)['sender'].close()
 
-    async def update_air_quality(self, client_id: str, lat: float, lon: float):
+    async def subscribe(self, client_id: str, lat: float, lon: float, last_event_id: Optional[str] = None):
+        """
+        Move a client to the location bucket for (lat, lon). A client resuming
+        at the location's current `last_event_id` is already up to date and
+        gets no snapshot.
+        """
         if client_id not in self.active_connections:
             return
 
-        websocket = self.active_connections[client_id]['websocket']
+        location_key = self.grid.snap(lat, lon).key
+        connection = self.active_connections[client_id]
+        if connection['location'] != location_key:
+            self.unsubscribe(client_id)
+            connection['location'] = location_key
+            self.subscriptions.setdefault(location_key, set()).add(client_id)
+
+        job_key = self._job_key(location_key)
+        if job_key not in self.scheduler:
+            # First subscriber: the job's first run (due now) reaches everyone
+            self.scheduler.schedule(
+                job_key, settings.WS_UPDATE_INTERVAL, lambda: self.update_location(location_key)
+            )
+        elif last_event_id is None or last_event_id != self.deltas.event_id(location_key):
+            self.send_snapshot(client_id)
+
+    def snapshot(self, client_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(frame, event id) with the full state of the client's location, if it has one yet"""
+        connection = self.active_connections.get(client_id)
+        if not connection or connection['location'] is None:
+            return None
+        frame = self.deltas.snapshot(connection['location'])
+        if frame is None:
+            return None
+        return frame, self.deltas.event_id(connection['location'])
+
+    def send_snapshot(self, client_id: str):
+        """Full state of the client's location, for new or out-of-sync clients"""
+        snapshot = self.snapshot(client_id)
+        if snapshot is not None:
+            self.send_frame(client_id, *snapshot)
+
+    def unsubscribe(self, client_id: str):
+        connection = self.active_connections.get(client_id)
+        if not connection or connection['location'] is None:
+            return
+
+        location_key = connection['location']
+        connection['location'] = None
+        subscribers = self.subscriptions.get(location_key)
+        if subscribers is not None:
+            subscribers.discard(client_id)
+            if not subscribers:
+                del self.subscriptions[location_key]
+                self.deltas.drop(location_key)
+                self.scheduler.cancel(self._job_key(location_key))
+                self.leases.release(self._job_key(location_key))
+                self.intervals.drop(self._job_key(location_key))
+
+    async def update_location(self, location_key: str) -> Optional[float]:
+        """
+        Refresh one location and publish the result to every worker.
+        Returns the adaptive delay until the next refresh, or a shorter retry
+        delay after a failed fetch.
+        """
+        job_key = self._job_key(location_key)
+        lease_ttl = location_lease_ttl(self.scheduler.effective_interval(job_key))
+        owner = self.leases.acquire(job_key, lease_ttl)
+        if not owner:
+            # Another worker polls this location; its readings arrive on the bus.
+            # Our interval state would only skew the budget
+            self.intervals.drop(job_key)
+            if location_key in self.deltas:
+                return None
+
+        next_delay = None
+        cell = self.grid.cell_for_key(location_key)
         try:
-            air_quality = await self.air_quality_service.get_air_quality(lat, lon)
-            
+            # Only a reading fetched since the last poll tells the adaptive
+            # interval anything; an older cached one would read as "unchanged"
+            air_quality = await self.air_quality_service.get_air_quality(
+                cell.lat, cell.lon, max_age=self.scheduler.since_last_run(job_key)
+            )
+            if location_key not in self.subscriptions:
+                return None  # Last subscriber left during the fetch
+            if owner:
+                next_delay = self.intervals.next_interval(
+                    job_key,
+                    aqi=calculate_aqi(air_quality.get('components') or {})['aqi'],
+                    observed_at=air_quality.get('timestamp'),
+                )
+                # Hold the lease until past the next poll, however far out it is
+                if location_lease_ttl(next_delay) > lease_ttl:
+                    self.leases.acquire(job_key, location_lease_ttl(next_delay))
+
             # Add timestamp and location info
             air_quality['timestamp'] = datetime.now().isoformat()
-            air_quality['location'] = {'lat': lat, 'lon': lon}
-            
-            await websocket.send_json({
-                'type': 'air_quality_update',
-                'data': air_quality
-            })
+            air_quality['location'] = {'lat': cell.lat, 'lon': cell.lon}
+            message = {'location': location_key, 'data': air_quality}
         except Exception as e:
-            logger.error(f"Error updating air quality for client {client_id}: {str(e)}")
-            await websocket.send_json({
+            logger.error(f"Error updating air quality for location {location_key}: {str(e)}")
+            message = {'location': location_key, 'error': str(e)}
+            next_delay = settings.WS_RETRY_INTERVAL
+
+        if owner:
+            self.bus.publish(self.topic, message)
+        else:
+            # First reading for our own subscribers while another worker owns
+            # the location (usually served from the shared cache)
+            self._on_bus_message(message)
+        return next_delay
+
+    def _on_bus_message(self, message: Dict[str, Any]):
+        location_key = message['location']
+        if location_key not in self.subscriptions:
+            return
+        event_id = None
+        full_frame = None
+        if 'error' in message:
+            frame = encode_frame({
                 'type': 'error',
-                'message': str(e)
+                'message': message['error']
             })
+        else:
+            frame = self.deltas.update(location_key, {'data': message['data']})
+            if frame is None:
+                return  # Nothing changed beyond the tolerance
+            event_id = self.deltas.event_id(location_key)
+            full_frame = self.deltas.snapshot(location_key)
+        self.broadcast(location_key, frame, event_id, full_frame)
+
+    def broadcast(
+        self, location_key: str, frame: str, event_id: Optional[str] = None, full_frame: Optional[str] = None
+    ):
+        """Queue `frame` for delta clients and `full_frame` (default: the same) for the rest"""
+        for client_id in list(self.subscriptions.get(location_key, ())):
+            connection = self.active_connections.get(client_id)
+            if connection is None:
+                continue
+            if full_frame is not None and not connection['deltas']:
+                connection['sender'].enqueue(full_frame, event_id)
+            else:
+                connection['sender'].enqueue(frame, event_id)
+
+    def send(self, client_id: str, message: Dict[str, Any]):
+        """Encode and queue a message for one client"""
+        self.send_frame(client_id, encode_frame(message))
+
+    def send_frame(self, client_id: str, frame: str, event_id: Optional[str] = None):
+        """Queue an encoded frame for a client; its sender does the actual send"""
+        connection = self.active_connections.get(client_id)
+        if connection:
+            connection['sender'].enqueue(frame, event_id)
 
 manager = ConnectionManager()
 
 @router.websocket("/ws/air-quality")
 async def websocket_endpoint(
     websocket: WebSocket,
-    token: str = Depends(get_current_user_ws)
+    deltas: bool = Query(False),
+    token: dict = Depends(get_current_user_ws)
 ):
-    client_id = token  # Use token as client ID
-    await manager.connect(websocket, client_id)
-    
+    if token is None:
+        return  # get_current_user_ws already closed the socket
+
+    # The token payload is a dict and identical across a user's tabs, so each
+    # connection gets its own id
+    client_id = uuid.uuid4().hex
+    # Delta frames only for clients that handle them (and ask for snapshots on a gap)
+    await manager.connect(websocket, client_id, deltas)
+
     try:
-        while True:
+        # The sender may drop the client (failed send, slow consumer) at any time
+        while client_id in manager.active_connections:
             try:
                 # Wait for client message
                 data = await websocket.receive_text()
-                
+
                 try:
                     msg = json.loads(data)
-                    if "latitude" in msg and "longitude" in msg:
+                    if msg.get("type") == "snapshot":
+                        # Client missed a seq and wants the full state again
+                        manager.send_snapshot(client_id)
+                    elif "latitude" in msg and "longitude" in msg:
                         lat = float(msg["latitude"])
                         lon = float(msg["longitude"])
-                        
+
                         # Validate coordinates
                         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
-                            await websocket.send_json({
+                            manager.send(client_id, {
                                 'type': 'error',
                                 'message': 'Invalid coordinates'
                             })
                             continue
-                        
-                        # Update air quality data
-                        await manager.update_air_quality(client_id, lat, lon)
-                        
-                        # Schedule periodic updates
-                        if manager.active_connections[client_id]['update_task']:
-                            manager.active_connections[client_id]['update_task'].cancel()
-                        
-                        task = asyncio.create_task(periodic_update(client_id, lat, lon))
-                        manager.active_connections[client_id]['update_task'] = task
-                        
-                except (json.JSONDecodeError, ValueError) as e:
-                    await websocket.send_json({
+
+                        # Join the location's shared update stream
+                        await manager.subscribe(client_id, lat, lon)
+
+                except (json.JSONDecodeError, ValueError, AttributeError):
+                    manager.send(client_id, {
                         'type': 'error',
                         'message': 'Invalid message format'
                     })
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
-                await websocket.send_json({
+                manager.send(client_id, {
                     'type': 'error',
                     'message': 'Internal server error'
                 })
-                
+
     except WebSocketDisconnect:
         manager.disconnect(client_id)
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
         manager.disconnect(client_id)
-
-async def periodic_update(client_id: str, lat: float, lon: float):
-    """Periodically update air quality data for a client"""
-    while True:
-        try:
-            await manager.update_air_quality(client_id, lat, lon)
-            await asyncio.sleep(300)  # Update every 5 minutes
-        except Exception as e:
-            logger.error(f"Error in periodic update for client {client_id}: {str(e)}")
-            await asyncio.sleep(5)  # Wait before retry
@@ -1,9 +1,10 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseSettings
 from pydantic import AnyHttpUrl
 from dotenv import load_dotenv
 import os
 import secrets
+from urllib.parse import quote_plus
 
 load_dotenv()
 
@@ -17,6 +18,100 @@ class Settings(BaseSettings):
     AIR_QUALITY_API_URL: str = "http://api.openweathermap.org/data/2.5/air_pollution"
     AIR_QUALITY_API_KEY: str = os.getenv("AIR_QUALITY_API_KEY", "")  # OpenWeatherMap API key
     
+    # Upstream provider: "openweathermap", "fake" (local stand-in), "record" or "replay"
+    AIR_QUALITY_PROVIDER: str = os.getenv("AIR_QUALITY_PROVIDER", "openweathermap")
+    AIR_QUALITY_RECORDINGS_DIR: str = os.getenv("AIR_QUALITY_RECORDINGS_DIR", "recordings/air_quality")
+    AIR_QUALITY_FAKE_LATENCY_MS: float = float(os.getenv("AIR_QUALITY_FAKE_LATENCY_MS", "80"))
+    AIR_QUALITY_FAKE_LATENCY_SIGMA: float = float(os.getenv("AIR_QUALITY_FAKE_LATENCY_SIGMA", "0.5"))
+    AIR_QUALITY_FAKE_ERROR_RATE: float = float(os.getenv("AIR_QUALITY_FAKE_ERROR_RATE", "0.0"))
+    AIR_QUALITY_FAKE_RATE_LIMIT_RATE: float = float(os.getenv("AIR_QUALITY_FAKE_RATE_LIMIT_RATE", "0.0"))
+    AIR_QUALITY_FAKE_TIMEOUT_RATE: float = float(os.getenv("AIR_QUALITY_FAKE_TIMEOUT_RATE", "0.0"))
+    AIR_QUALITY_FAKE_SEED: Optional[int] = int(os.environ["AIR_QUALITY_FAKE_SEED"]) if os.getenv("AIR_QUALITY_FAKE_SEED") else None
+    
+    # Upstream HTTP client (shared connection pool)
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "10.0"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5.0"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+    HTTP_ENABLE_HTTP2: bool = os.getenv("HTTP_ENABLE_HTTP2", "true").lower() == "true"
+    
+    # Air quality reading cache
+    AIR_QUALITY_CACHE_TTL: float = float(os.getenv("AIR_QUALITY_CACHE_TTL", "300"))  # 5 minutes
+    AIR_QUALITY_CACHE_MAX_ENTRIES: int = int(os.getenv("AIR_QUALITY_CACHE_MAX_ENTRIES", "10000"))
+    # Expired entries are still served for this long while a background refresh runs
+    AIR_QUALITY_CACHE_STALE_TTL: float = float(os.getenv("AIR_QUALITY_CACHE_STALE_TTL", "600"))
+    # Optional cross-worker L2 cache: "none", "sqlite" (shared file) or "memory"
+    AIR_QUALITY_SHARED_CACHE: str = os.getenv("AIR_QUALITY_SHARED_CACHE", "none")
+    AIR_QUALITY_SHARED_CACHE_PATH: str = os.getenv("AIR_QUALITY_SHARED_CACHE_PATH", "/tmp/air_quality_cache.sqlite3")
+    
+    # Proactive refresh of the most requested locations
+    AIR_QUALITY_REFRESH_TOP_N: int = int(os.getenv("AIR_QUALITY_REFRESH_TOP_N", "100"))
+    AIR_QUALITY_REFRESH_INTERVAL: float = float(os.getenv("AIR_QUALITY_REFRESH_INTERVAL", "30"))
+    AIR_QUALITY_REFRESH_AHEAD: float = float(os.getenv("AIR_QUALITY_REFRESH_AHEAD", "60"))
+    
+    # Upstream governor: token bucket sized to the provider quota plus circuit breaker
+    AIR_QUALITY_RATE_LIMIT_PER_SECOND: float = float(os.getenv("AIR_QUALITY_RATE_LIMIT_PER_SECOND", "1.0"))
+    AIR_QUALITY_RATE_LIMIT_BURST: float = float(os.getenv("AIR_QUALITY_RATE_LIMIT_BURST", "10"))
+    AIR_QUALITY_RATE_LIMIT_MAX_WAIT: float = float(os.getenv("AIR_QUALITY_RATE_LIMIT_MAX_WAIT", "2.0"))
+    AIR_QUALITY_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("AIR_QUALITY_BREAKER_FAILURE_THRESHOLD", "5"))
+    AIR_QUALITY_BREAKER_RESET_TIMEOUT: float = float(os.getenv("AIR_QUALITY_BREAKER_RESET_TIMEOUT", "30"))
+    
+    # WebSocket refresh scheduling
+    WS_UPDATE_INTERVAL: float = float(os.getenv("WS_UPDATE_INTERVAL", "300"))  # 5 minutes
+    WS_RETRY_INTERVAL: float = float(os.getenv("WS_RETRY_INTERVAL", "5"))
+    WS_REFRESH_CONCURRENCY: int = int(os.getenv("WS_REFRESH_CONCURRENCY", "50"))
+    WS_REFRESH_JITTER: float = float(os.getenv("WS_REFRESH_JITTER", "0.1"))  # +/- fraction of the interval
+    WS_REFRESH_TIMEOUT: float = float(os.getenv("WS_REFRESH_TIMEOUT", "30"))  # per location, per run
+    
+    # Adaptive per-location intervals (WS_UPDATE_INTERVAL is the base): shorter while AQI
+    # rises quickly or changes category, longer while it is stable or the upstream reading is unchanged
+    WS_MIN_INTERVAL: float = float(os.getenv("WS_MIN_INTERVAL", "60"))
+    WS_MAX_INTERVAL: float = float(os.getenv("WS_MAX_INTERVAL", "1800"))
+    WS_AQI_FAST_CHANGE: float = float(os.getenv("WS_AQI_FAST_CHANGE", "10"))  # AQI points per refresh
+    WS_AQI_STABLE_CHANGE: float = float(os.getenv("WS_AQI_STABLE_CHANGE", "2"))
+    # Upstream polls per minute across all workers (those sharing the sqlite lease store); 0 = unlimited
+    WS_REFRESH_BUDGET_PER_MINUTE: float = float(os.getenv("WS_REFRESH_BUDGET_PER_MINUTE", "48"))
+    
+    # Per-connection outbound queues: slow consumer policy is "drop_oldest", "coalesce" or "disconnect"
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "16"))
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    SSE_HEARTBEAT_INTERVAL: float = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))  # idle SSE keepalive comment
+    
+    # Change-only pushes: readings within tolerance of the last frame sent are skipped.
+    # Clients get full frames unless they connect with ?deltas=1 (and WS_DELTA_UPDATES allows it)
+    WS_DELTA_UPDATES: bool = os.getenv("WS_DELTA_UPDATES", "true").lower() == "true"
+    WS_CHANGE_ABS_TOLERANCE: float = float(os.getenv("WS_CHANGE_ABS_TOLERANCE", "0.01"))
+    WS_CHANGE_REL_TOLERANCE: float = float(os.getenv("WS_CHANGE_REL_TOLERANCE", "0.01"))
+    
+    # Multi-worker fan-out: "memory" (single process) or "unix" (datagram sockets in WS_BUS_PATH),
+    # and per-location polling leases: "memory" or "sqlite" (file at WS_LEASE_PATH)
+    WS_BUS_BACKEND: str = os.getenv("WS_BUS_BACKEND", "memory")
+    WS_BUS_PATH: str = os.getenv("WS_BUS_PATH", "/tmp/climate-action-ws-bus")
+    WS_LEASE_BACKEND: str = os.getenv("WS_LEASE_BACKEND", "memory")
+    WS_LEASE_PATH: str = os.getenv("WS_LEASE_PATH", "/tmp/climate-action-ws-leases.db")
+    
+    # Spatial bucketing of coordinates: "grid" (fixed degrees) or "geohash"
+    AIR_QUALITY_GRID_MODE: str = os.getenv("AIR_QUALITY_GRID_MODE", "grid")
+    AIR_QUALITY_GRID_DEGREES: float = float(os.getenv("AIR_QUALITY_GRID_DEGREES", "0.05"))  # ~5.5 km
+    AIR_QUALITY_GEOHASH_PRECISION: int = int(os.getenv("AIR_QUALITY_GEOHASH_PRECISION", "5"))  # ~4.9 km
+    
+    # Batch lookups
+    AIR_QUALITY_BATCH_MAX_ITEMS: int = int(os.getenv("AIR_QUALITY_BATCH_MAX_ITEMS", "500"))
+    AIR_QUALITY_BATCH_CONCURRENCY: int = int(os.getenv("AIR_QUALITY_BATCH_CONCURRENCY", "10"))
+    
+    # Write-behind report inserts: rows a request waits on are written at once
+    # (together with whatever queued during the previous write); others when
+    # REPORT_WRITE_BATCH_SIZE rows are pending or REPORT_WRITE_INTERVAL seconds
+    # after the first. Submitters wait once REPORT_WRITE_MAX_PENDING are queued
+    REPORT_WRITE_BATCH_SIZE: int = int(os.getenv("REPORT_WRITE_BATCH_SIZE", "500"))
+    REPORT_WRITE_INTERVAL: float = float(os.getenv("REPORT_WRITE_INTERVAL", "0.5"))
+    REPORT_WRITE_MAX_PENDING: int = int(os.getenv("REPORT_WRITE_MAX_PENDING", "10000"))
+    
+    # Location identity -> id, so resolving a report's location usually skips the database
+    LOCATION_CACHE_MAX_ENTRIES: int = int(os.getenv("LOCATION_CACHE_MAX_ENTRIES", "10000"))
+    
     # CORS Configuration
     BACKEND_CORS_ORIGINS: List[str] = [
         "http://localhost:3000",  # Default Next.js port
@@ -34,15 +129,46 @@ class Settings(BaseSettings):
     
     @property
     def get_database_url(self) -> str:
-        """Get database URL with proper SSL mode for production"""
-        url = f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}"
-        if 'railway.app' in self.MYSQL_HOST or os.getenv('ENVIRONMENT') == 'production':
-            # Add SSL mode for production database
-            if '?' not in url:
-                url += '?ssl_mode=REQUIRED'
-            else:
-                url += '&ssl_mode=REQUIRED'
-        return url
+        """
+        Get database URL for the sync engine. In production, TLS is enabled
+        through connect args (see `database_requires_ssl`): PyMySQL has no
+        `ssl_mode` URL option.
+        """
+        return (
+            f"mysql+pymysql://{self.MYSQL_USER}:{quote_plus(self.MYSQL_PASSWORD)}"
+            f"@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}"
+        )
+    
+    # Connection pool, per engine and per worker (size + overflow is the most
+    # connections a worker opens); pre-ping trades a round trip per checkout for
+    # never handing out a dead connection
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a checkout
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "300"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_USE_LIFO: bool = os.getenv("DB_POOL_USE_LIFO", "true").lower() == "true"  # lets idle extras time out
+
+    # Async engine for the async routes; set e.g. "sqlite+aiosqlite:///./local.db" for local runs
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
+
+    @property
+    def get_async_database_url(self) -> str:
+        """ASYNC_DATABASE_URL, or the MySQL settings with the aiomysql driver"""
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        return (
+            f"mysql+aiomysql://{self.MYSQL_USER}:{quote_plus(self.MYSQL_PASSWORD)}"
+            f"@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}"
+        )
+
+    @property
+    def database_requires_ssl(self) -> bool:
+        return 'railway.app' in self.MYSQL_HOST or os.getenv('ENVIRONMENT') == 'production'
+
+    # CA bundle for the database server's certificate. Unset, TLS is required
+    # but the certificate isn't verified (MySQL's ssl_mode=REQUIRED)
+    DB_SSL_CA: str = os.getenv("DB_SSL_CA", "")
     
     # JWT settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-local-secret-key-here")
@@ -0,0 +1,5 @@
+"""Dependencies shared by the async API routes"""
+from app.core.auth import get_current_user
+from app.core.database import get_async_db
+
+__all__ = ["get_async_db", "get_current_user"]
@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool
+
+
+class PoolMetrics:
+    """
+    Connection pool counters fed by SQLAlchemy pool events, plus checkout
+    wait times from `timed_pool_class`. Enough to size DB_POOL_SIZE and
+    DB_MAX_OVERFLOW from data: sustained waits or overflow mean the pool is
+    too small, high churn means connections are being dropped and reopened.
+    """
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.max_overflow_seen = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._waits: Deque[float] = deque(maxlen=window)
+
+    def attach(self, pool: Pool) -> None:
+        self.pool = pool
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "close", self._on_close)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self.connects += 1
+
+    def _on_close(self, dbapi_connection, connection_record) -> None:
+        self.closes += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self.invalidations += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        overflow = getattr(self.pool, "overflow", None)
+        if overflow is not None:
+            self.max_overflow_seen = max(self.max_overflow_seen, overflow())
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.checkins += 1
+        self.in_use = max(0, self.in_use - 1)
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self._waits.append(seconds)
+
+    def _percentile(self, q: float) -> float:
+        if not self._waits:
+            return 0.0
+        ordered = sorted(self._waits)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool
+        return {
+            "name": self.name,
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else self.in_use,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "max_in_use": self.max_in_use,
+            "max_overflow_seen": self.max_overflow_seen,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.waits if self.waits else 0.0,
+            "wait_p95": self._percentile(0.95),
+            "wait_max": self.wait_max,
+            # Churn: physical connections opened and closed
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+        }
+
+
+def timed_pool_class(base: Type[Pool], metrics: PoolMetrics) -> Type[Pool]:
+    """
+    `base` with checkout wait timing. There is no pool event for the start
+    of a checkout, so the wait is measured around the pool's `_do_get`
+    (which includes opening a new connection when the pool grows).
+    """
+
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                metrics.timeouts += 1
+                raise
+            finally:
+                metrics.record_wait(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
@@ -1,7 +1,24 @@
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.http_client import start_http_client, close_http_client
+from app.core.database import async_pool_metrics, sync_pool_metrics
+from app.services.cache import air_quality_cache
+from app.services.singleflight import air_quality_flights
+from app.services.refresher import air_quality_refresher
+from app.services.upstream_governor import air_quality_governor
+from app.services.providers import air_quality_provider
+from app.services.scheduler import refresh_scheduler
+from app.services.broadcast_bus import broadcast_bus
+from app.services.leases import location_leases
+from app.services.adaptive_interval import refresh_intervals
+from app.services.report_writer import report_writer
+from app.services.locations import location_resolver
+from app.websockets.sender import sender_metrics
+from app.api.api_v1.endpoints.websocket import manager as ws_manager, router as websocket_router
+from app.websockets.air_quality import air_quality_ws
 from app.api.v1.api import api_router
+from app.api.api_v1.endpoints import air_quality
 from fastapi.responses import JSONResponse
 
 app = FastAPI(
@@ -20,13 +37,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared upstream HTTP pool, background refresher, report writer, broadcast bus and scheduler live for the lifetime of the worker
+@app.on_event("startup")
+async def startup():
+    await start_http_client()
+    air_quality_refresher.start()
+    report_writer.start()
+    broadcast_bus.start()
+    refresh_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await refresh_scheduler.stop()
+    broadcast_bus.stop()
+    await air_quality_refresher.stop()
+    # Queued reports are written before the worker exits
+    await report_writer.stop()
+    await air_quality_provider.aclose()
+    await close_http_client()
+
 # Health check endpoint
 @app.get("/api/v1/health")
 def health_check():
     return JSONResponse({"status": "healthy"})
 
+# Runtime counters for monitoring
+@app.get("/api/v1/metrics")
+def metrics():
+    return JSONResponse({
+        "air_quality_cache": air_quality_cache.stats(),
+        "air_quality_flights": air_quality_flights.stats(),
+        "air_quality_refresher": air_quality_refresher.stats(),
+        "air_quality_upstream": air_quality_governor.stats(),
+        "refresh_scheduler": refresh_scheduler.stats(),
+        "refresh_intervals": refresh_intervals.stats(),
+        "ws_send_queues": sender_metrics.stats(),
+        "ws_updates": ws_manager.deltas.stats(),
+        "ws_air_quality": air_quality_ws.stats(),
+        "ws_bus": broadcast_bus.stats(),
+        "ws_leases": location_leases.stats(),
+        "report_writer": report_writer.stats(),
+        "location_cache": location_resolver.stats(),
+        "db_pool": [sync_pool_metrics.stats(), async_pool_metrics.stats()],
+    })
+
+# Effective refresh interval (seconds) of every scheduled location
+@app.get("/api/v1/metrics/refresh-intervals")
+def refresh_interval_metrics():
+    return JSONResponse(refresh_scheduler.intervals())
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(air_quality.router, prefix=f"{settings.API_V1_STR}/air-quality", tags=["air-quality"])
+app.include_router(websocket_router, prefix=settings.API_V1_STR)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Table
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Table, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
+# One `users` table: the model the auth flow and the migrations use
+from app.models.user import User
+from app.models.blog import BlogPost  # noqa: F401  (target of User.posts)
 
 # Association table for user roles
 user_roles = Table(
@@ -11,22 +14,6 @@ user_roles = Table(
     Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True)
 )
 
-class User(Base):
-    __tablename__ = 'users'
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String(255), unique=True, index=True, nullable=False)
-    firebase_uid = Column(String(255), unique=True, nullable=False)
-    full_name = Column(String(255), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    is_active = Column(Boolean, default=True)
-    
-    # Relationships
-    roles = relationship("Role", secondary=user_roles, back_populates="users")
-    air_quality_reports = relationship("AirQualityReport", back_populates="user")
-    action_plans = relationship("ActionPlan", back_populates="user")
-
 class Role(Base):
     __tablename__ = 'roles'
     
@@ -35,10 +22,11 @@ class Role(Base):
     description = Column(String(255))
     
     # Relationships
-    users = relationship("User", secondary=user_roles, back_populates="roles")
+    users = relationship("User", secondary=user_roles)
 
 class Location(Base):
     __tablename__ = 'locations'
+    __table_args__ = (UniqueConstraint('identity_key', name='uq_locations_identity_key'),)
     
     id = Column(Integer, primary_key=True, index=True)
     city = Column(String(100), nullable=False)
@@ -46,12 +34,16 @@ class Location(Base):
     country = Column(String(100), nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    # Hash of the normalized identity, see app.services.locations.location_identity
+    identity_key = Column(String(64), nullable=False)
     
     # Relationships
     air_quality_reports = relationship("AirQualityReport", back_populates="location")
 
 class AirQualityReport(Base):
     __tablename__ = 'air_quality_reports'
+    # Per-user history, newest first, with keyset pagination
+    __table_args__ = (Index('ix_air_quality_reports_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),)
     
     id = Column(Integer, primary_key=True, index=True)
     aqi = Column(Float, nullable=False)
@@ -66,7 +58,7 @@ class AirQualityReport(Base):
     location_id = Column(Integer, ForeignKey('locations.id'))
     
     # Relationships
-    user = relationship("User", back_populates="air_quality_reports")
+    user = relationship("User")
     location = relationship("Location", back_populates="air_quality_reports")
 
 class ActionPlan(Base):
@@ -83,7 +75,7 @@ class ActionPlan(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     
     # Relationships
-    user = relationship("User", back_populates="action_plans")
+    user = relationship("User")
     actions = relationship("Action", back_populates="action_plan")
 
 class Action(Base):
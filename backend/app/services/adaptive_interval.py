@@ -0,0 +1,131 @@
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.aqi import category
+from app.services.leases import LeaseStore, location_leases
+
+
+class _IntervalState:
+    __slots__ = ("interval", "aqi", "observed_at")
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.aqi: Optional[float] = None
+        self.observed_at: Optional[str] = None
+
+
+class AdaptiveIntervals:
+    """
+    Per-location refresh intervals that follow how fast conditions change:
+
+    - the upstream reading hasn't advanced: back off (x1.5)
+    - AQI rising by `fast_change` or more, or crossing a category: halve
+    - AQI within `stable_change` of the last reading: stretch (x1.25)
+    - otherwise: move halfway back towards `base`
+
+    always within [`minimum`, `maximum`]. On top of that, all locations
+    together stay within `budget_per_minute` upstream calls: when the sum
+    of their rates exceeds it, every interval is stretched by the same
+    factor, so relative priorities are kept. With `leases`, each worker
+    reports its rate there and the budget covers every worker's locations;
+    without, it covers this worker's only.
+    """
+
+    def __init__(
+        self,
+        base: float,
+        minimum: float,
+        maximum: float,
+        budget_per_minute: float = 0.0,
+        fast_change: float = 10.0,
+        stable_change: float = 2.0,
+        leases: Optional[LeaseStore] = None,
+    ):
+        if base <= 0 or minimum <= 0:
+            raise ValueError("Intervals must be positive")
+        self.base = base
+        # The base interval always lies within the bounds
+        self.minimum = min(minimum, base)
+        self.maximum = max(maximum, base)
+        self.budget_per_minute = budget_per_minute
+        self.fast_change = fast_change
+        self.stable_change = stable_change
+        self.leases = leases
+        self._states: Dict[str, _IntervalState] = {}
+        self._total_rate = 0.0  # Upstream calls per second across this worker's locations
+        self._shared_rate = 0.0  # ... and across every worker's, as of the last report
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.maximum, max(self.minimum, interval))
+
+    def _adjust(self, state: _IntervalState, aqi: Optional[float], observed_at: Optional[str]) -> float:
+        if observed_at is not None and observed_at == state.observed_at:
+            return state.interval * 1.5
+        if aqi is None or state.aqi is None:
+            return state.interval
+        change = aqi - state.aqi
+        if change >= self.fast_change or category(aqi) != category(state.aqi):
+            return state.interval / 2
+        if abs(change) < self.stable_change:
+            return state.interval * 1.25
+        return (state.interval + self.base) / 2
+
+    def next_interval(self, key: str, aqi: Optional[float] = None, observed_at: Optional[str] = None) -> float:
+        """Record a reading for `key` and return the delay until its next refresh"""
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _IntervalState(self.base)
+            self._total_rate += 1 / state.interval
+        else:
+            self._total_rate -= 1 / state.interval
+            state.interval = self._clamp(self._adjust(state, aqi, observed_at))
+            self._total_rate += 1 / state.interval
+        if aqi is not None:
+            state.aqi = aqi
+        if observed_at is not None:
+            state.observed_at = observed_at
+        if self.leases is not None and self.budget_per_minute > 0:
+            self._shared_rate = self.leases.share_rate(self._total_rate)
+        return state.interval * self.budget_factor()
+
+    def budget_factor(self) -> float:
+        """How much every interval is currently stretched to stay within the budget"""
+        if self.budget_per_minute <= 0:
+            return 1.0
+        return max(1.0, self._rate() * 60 / self.budget_per_minute)
+
+    def _rate(self) -> float:
+        # Our own share may have changed since the last report
+        if self.leases is None:
+            return self._total_rate
+        return max(self._shared_rate, self._total_rate)
+
+    def drop(self, key: str) -> None:
+        state = self._states.pop(key, None)
+        if state is not None:
+            self._total_rate -= 1 / state.interval
+            if not self._states:
+                self._total_rate = 0.0  # Reset float drift
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "locations": len(self._states),
+            "calls_per_minute": self._total_rate * 60,
+            "all_workers_calls_per_minute": self._rate() * 60,
+            "budget_per_minute": self.budget_per_minute,
+            "budget_factor": self.budget_factor(),
+        }
+
+
+refresh_intervals = AdaptiveIntervals(
+    base=settings.WS_UPDATE_INTERVAL,
+    minimum=settings.WS_MIN_INTERVAL,
+    maximum=settings.WS_MAX_INTERVAL,
+    budget_per_minute=settings.WS_REFRESH_BUDGET_PER_MINUTE,
+    fast_change=settings.WS_AQI_FAST_CHANGE,
+    stable_change=settings.WS_AQI_STABLE_CHANGE,
+    leases=location_leases,
+)
@@ -1,16 +1,24 @@
-import aiohttp
-from app.core.config import settings
+from app.services.readings import CellReadings, cell_readings
+from app.services.upstream_governor import UpstreamUnavailable
+from app.services.spatial import SpatialGrid, air_quality_grid
 from typing import Dict, Any, Optional
 from fastapi import HTTPException
-from app.core.config import settings
 import httpx
 from datetime import datetime
 
 class AirQualityData:
     def __init__(self, data: Dict[str, Any]):
+        # Unwrap OpenWeatherMap's `list[0]` envelope
+        if data.get('list'):
+            entry = data['list'][0]
+            data = {
+                'aqi': entry.get('main', {}).get('aqi'),
+                'components': entry.get('components', {}),
+                'timestamp': datetime.utcfromtimestamp(entry['dt']).isoformat() if 'dt' in entry else None,
+            }
         self.aqi = data.get('aqi')
         self.components = data.get('components', {})
-        self.timestamp = data.get('timestamp', datetime.now().isoformat())
+        self.timestamp = data.get('timestamp') or datetime.now().isoformat()
         self.location = data.get('location', '')
 
     def to_dict(self) -> Dict[str, Any]:
@@ -29,48 +37,41 @@ class AirQualityData:
             raise ValueError(f"Invalid longitude: {lon}. Must be between -180 and 180.")
 
 class AirQualityService:
-    def __init__(self):
-        self.api_key = settings.AIR_QUALITY_API_KEY
-        self.base_url = settings.AIR_QUALITY_API_URL
-        self._cache: Dict[str, AirQualityData] = {}
-        self._cache_duration = 300  # 5 minutes
+    def __init__(
+        self,
+        grid: Optional[SpatialGrid] = None,
+        readings: Optional[CellReadings] = None,
+    ):
+        self.grid = grid if grid is not None else air_quality_grid
+        # Same cache entry and in-flight fetch per cell as the REST path
+        self._readings = readings if readings is not None else cell_readings
 
-    def _get_cache_key(self, lat: float, lon: float) -> str:
-        return f"{lat:.4f},{lon:.4f}"
-
-    async def get_air_quality(self, lat: float, lon: float) -> Dict[str, Any]:
+    async def get_air_quality(self, lat: float, lon: float, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Reading for the grid cell around (lat, lon). With `max_age`, a cached
+        reading written longer ago than that is fetched again.
+        """
         try:
             # Validate coordinates
             AirQualityData.validate_coordinates(lat, lon)
 
-            # Check cache
-            cache_key = self._get_cache_key(lat, lon)
-            cached_data = self._cache.get(cache_key)
-            if cached_data:
-                return cached_data.to_dict()
-
-            # Fetch new data
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/air_quality",
-                    params={
-                        "lat": lat,
-                        "lon": lon,
-                        "key": self.api_key
-                    }
-                )
+            # Nearby coordinates share one grid cell, fetched at its centroid
+            cell = self.grid.snap(lat, lon)
 
-                if response.status_code == 429:
-                    raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
-                
-                response.raise_for_status()
-                data = response.json()
+            raw = await self._readings.get(cell, max_age=max_age)
 
-                # Process and cache the data
-                air_quality_data = AirQualityData(data)
-                self._cache[cache_key] = air_quality_data
-                return air_quality_data.to_dict()
+            result = AirQualityData(raw).to_dict()
+            result['cell'] = cell.to_dict()
+            return result
 
+        except HTTPException:
+            raise
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
+            raise HTTPException(status_code=502, detail=f"Error fetching air quality data: {str(e)}")
+        except UpstreamUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Air quality provider unavailable: {str(e)}")
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except httpx.TimeoutException:
@@ -1,32 +1,92 @@
-import aiohttp
 import asyncio
-from typing import Dict, Optional
+import logging
+import httpx
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from app.core.config import settings
-from app.models.models import AirQualityReport, Location
-from sqlalchemy.orm import Session
+from app.services.aqi import calculate_aqi
+from app.services.readings import CellReadings, cell_readings
+from app.services.upstream_governor import UpstreamUnavailable
+from app.services.spatial import GridCell, SpatialGrid, air_quality_grid
+from app.services.report_writer import BatchWriter, report_writer
+from app.services.locations import LocationResolver, location_resolver
+from app.models.models import AirQualityReport
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
 
 class AirQualityService:
-    def __init__(self):
-        self.api_key = settings.AIR_QUALITY_API_KEY
-        self.base_url = "http://api.openweathermap.org/data/2.5/air_pollution"
-    
-    async def get_air_quality_data(self, lat: float, lon: float) -> Optional[Dict]:
-        """Fetch air quality data from OpenWeatherMap API"""
-        url = f"{self.base_url}?lat={lat}&lon={lon}&appid={self.api_key}"
-        
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return self._process_air_quality_data(data)
-                    else:
-                        print(f"Error fetching air quality data: {response.status}")
-                        return None
-            except Exception as e:
-                print(f"Exception while fetching air quality data: {e}")
-                return None
+    def __init__(
+        self,
+        grid: Optional[SpatialGrid] = None,
+        readings: Optional[CellReadings] = None,
+        writer: Optional[BatchWriter] = None,
+        locations: Optional[LocationResolver] = None,
+    ):
+        self.grid = grid if grid is not None else air_quality_grid
+        # Same cache entry and in-flight fetch per cell as the WebSocket path
+        self._readings = readings if readings is not None else cell_readings
+        self._writer = writer if writer is not None else report_writer
+        self._locations = locations if locations is not None else location_resolver
+
+    async def get_air_quality_data(self, lat: float, lon: float, max_age: Optional[float] = None) -> Optional[Dict]:
+        """
+        Fetch air quality data from OpenWeatherMap API. With `max_age`, a
+        cached reading written longer ago than that is fetched again.
+        """
+        # Nearby coordinates share one grid cell, fetched at its centroid
+        return await self._get_cell_data(self.grid.snap(lat, lon), max_age=max_age)
+
+    async def get_air_quality_batch(self, coordinates: List[Tuple[float, float]]) -> List[Dict]:
+        """
+        Fetch readings for many coordinates at once. Coordinates are deduped by
+        grid cell, cache misses are fetched concurrently (bounded by
+        AIR_QUALITY_BATCH_CONCURRENCY) and results come back in input order,
+        each with either `data` or `error` set.
+        """
+        cells = [self.grid.snap(lat, lon) for lat, lon in coordinates]
+        unique = list({cell.key: cell for cell in cells}.values())
+        semaphore = asyncio.Semaphore(settings.AIR_QUALITY_BATCH_CONCURRENCY)
+
+        fetched = await asyncio.gather(
+            *(self._get_cell_data(cell, semaphore) for cell in unique),
+            return_exceptions=True
+        )
+        by_key = dict(zip((cell.key for cell in unique), fetched))
+
+        results = []
+        for (lat, lon), cell in zip(coordinates, cells):
+            data = by_key[cell.key]
+            item = {'latitude': lat, 'longitude': lon, 'data': None, 'error': None}
+            if isinstance(data, Exception):
+                item['error'] = str(data) or type(data).__name__
+            elif not data:
+                item['error'] = "Failed to fetch air quality data"
+            else:
+                item['data'] = data
+            results.append(item)
+        return results
+
+    async def _get_cell_data(
+        self, cell: GridCell, semaphore: Optional[asyncio.Semaphore] = None, max_age: Optional[float] = None
+    ) -> Optional[Dict]:
+        try:
+            raw = await self._readings.get(cell, max_age=max_age, semaphore=semaphore)
+        except UpstreamUnavailable as e:
+            logger.info(f"Skipped air quality fetch: {e}")
+            return None
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"Error fetching air quality data: {e.response.status_code}")
+            return None
+        except Exception as e:
+            logger.error(f"Exception while fetching air quality data: {e}")
+            return None
+
+        data = self._process_air_quality_data(raw)
+        if not data:
+            return None
+        data['cell'] = cell.to_dict()
+        return data
 
     def _process_air_quality_data(self, data: Dict) -> Dict:
         """Process the raw API response into our format"""
@@ -35,39 +95,26 @@ class AirQualityService:
         
         aqi_data = data['list'][0]['components']
         aqi_level = data['list'][0]['main']['aqi']
+        observed_at = data['list'][0].get('dt')
+        us_aqi = calculate_aqi(aqi_data)
         
         return {
-            'aqi': self._calculate_us_aqi(aqi_data),
+            'aqi': us_aqi['aqi'] or 0,
+            'aqi_category': us_aqi['category'],
+            'dominant_pollutant': us_aqi['dominant_pollutant'],
             'raw_aqi': aqi_level,
             'pm25': aqi_data.get('pm2_5', 0),
             'pm10': aqi_data.get('pm10', 0),
             'o3': aqi_data.get('o3', 0),
             'no2': aqi_data.get('no2', 0),
             'so2': aqi_data.get('so2', 0),
-            'co': aqi_data.get('co', 0)
+            'co': aqi_data.get('co', 0),
+            'observed_at': datetime.utcfromtimestamp(observed_at).isoformat() if observed_at else None
         }
 
-    def _calculate_us_aqi(self, components: Dict) -> float:
-        """Calculate US AQI from pollutant concentrations"""
-        # This is a simplified calculation - you might want to implement
-        # the full EPA algorithm for production use
-        pm25 = components.get('pm2_5', 0)
-        if pm25 <= 12.0:
-            return (50 - 0) * (pm25 - 0) / (12.0 - 0) + 0
-        elif pm25 <= 35.4:
-            return (100 - 51) * (pm25 - 12.1) / (35.4 - 12.1) + 51
-        elif pm25 <= 55.4:
-            return (150 - 101) * (pm25 - 35.5) / (55.4 - 35.5) + 101
-        elif pm25 <= 150.4:
-            return (200 - 151) * (pm25 - 55.5) / (150.4 - 55.5) + 151
-        elif pm25 <= 250.4:
-            return (300 - 201) * (pm25 - 150.5) / (250.4 - 150.5) + 201
-        else:
-            return (500 - 301) * (pm25 - 250.5) / (500.4 - 250.5) + 301
-
     async def save_air_quality_report(
         self, 
-        db: Session,
+        db: AsyncSession,
         lat: float,
         lon: float,
         city: str,
@@ -75,35 +122,22 @@ class AirQualityService:
         country: str,
         user_id: int
     ) -> Optional[AirQualityReport]:
-        """Fetch air quality data and save it to the database"""
+        """
+        Fetch air quality data and save it to the database. The report is
+        written through the write-behind buffer, so concurrent saves share
+        one INSERT and COMMIT; this returns once it is committed.
+        """
         try:
             # Get air quality data from API
             air_quality_data = await self.get_air_quality_data(lat, lon)
             if not air_quality_data:
                 return None
 
-            # Create or get location
-            location = db.query(Location).filter_by(
-                city=city,
-                state=state,
-                country=country,
-                latitude=lat,
-                longitude=lon
-            ).first()
-
-            if not location:
-                location = Location(
-                    city=city,
-                    state=state,
-                    country=country,
-                    latitude=lat,
-                    longitude=lon
-                )
-                db.add(location)
-                db.flush()
+            # Create or get location (usually from the in-process cache)
+            location_id = await self._locations.resolve(db, city, state, country, lat, lon)
 
-            # Create air quality report
-            report = AirQualityReport(
+            # Queue the air quality report
+            row = dict(
                 aqi=air_quality_data['aqi'],
                 pm25=air_quality_data['pm25'],
                 pm10=air_quality_data['pm10'],
@@ -112,15 +146,13 @@ class AirQualityService:
                 so2=air_quality_data['so2'],
                 co=air_quality_data['co'],
                 user_id=user_id,
-                location_id=location.id,
+                location_id=location_id,
                 timestamp=datetime.utcnow()
             )
-            
-            db.add(report)
-            db.commit()
-            return report
+            report_id = await self._writer.write(row)
+            return AirQualityReport(id=report_id, **row)
 
         except Exception as e:
-            print(f"Error saving air quality report: {e}")
-            db.rollback()
+            logger.error(f"Error saving air quality report: {e}")
+            await db.rollback()
             return None
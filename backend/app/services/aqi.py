@@ -0,0 +1,219 @@
+"""
+US EPA Air Quality Index engine.
+
+Concentrations come in as µg/m³ (the unit OpenWeatherMap reports for every
+pollutant) and are converted to each pollutant's EPA unit, truncated to the
+EPA-reported precision and scored against the breakpoint tables below. The
+overall AQI is the highest sub-index; the pollutant that sets it is the
+dominant pollutant.
+
+`calculate_aqi` scores one reading in pure Python. `calculate_aqi_batch`
+scores arrays of readings in one call with NumPy.
+"""
+import math
+from bisect import bisect_left
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is only needed for batch scoring
+    np = None
+
+# Molar volume of an ideal gas at 25 °C and 1 atm, in litres
+_MOLAR_VOLUME = 24.45
+
+# (c_lo, c_hi, i_lo, i_hi) in the pollutant's EPA unit
+Breakpoints = Sequence[Tuple[float, float, int, int]]
+
+
+class Pollutant:
+    def __init__(
+        self,
+        name: str,
+        component: str,
+        unit: str,
+        decimals: int,
+        breakpoints: Breakpoints,
+        molecular_weight: Optional[float] = None,
+        secondary: Optional[Breakpoints] = None,
+    ):
+        self.name = name
+        self.component = component
+        self.unit = unit
+        self.decimals = decimals
+        self.breakpoints = breakpoints
+        self.molecular_weight = molecular_weight
+        self.c_hi = [bp[1] for bp in breakpoints]
+        # A second table for the same pollutant (O3's 1-hour table). From its
+        # first breakpoint up, the sub-index is the higher of the two, and the
+        # primary table holds at its top band above its range instead of
+        # jumping to AQI_MAX, so a rising concentration never lowers the AQI.
+        self.secondary = secondary
+        self.secondary_c_hi = [bp[1] for bp in secondary] if secondary else None
+        self.above = breakpoints[-1][3] if secondary else AQI_MAX
+
+    def convert(self, ugm3: float) -> float:
+        """µg/m³ -> EPA unit (µg/m³, ppb or ppm)"""
+        if self.unit == "ug/m3":
+            return ugm3
+        ppb = ugm3 * _MOLAR_VOLUME / self.molecular_weight
+        return ppb / 1000 if self.unit == "ppm" else ppb
+
+
+AQI_MAX = 500
+
+# EPA breakpoints (PM2.5 per the 2024 NAAQS revision). O3 is scored on both
+# the 8-hour table (which ends at 200 ppb) and the 1-hour table (from 125 ppb),
+# taking the higher sub-index.
+POLLUTANTS = (
+    Pollutant("pm25", "pm2_5", "ug/m3", 1, (
+        (0.0, 9.0, 0, 50), (9.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
+        (55.5, 125.4, 151, 200), (125.5, 225.4, 201, 300), (225.5, 325.4, 301, 500),
+    )),
+    Pollutant("pm10", "pm10", "ug/m3", 0, (
+        (0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150),
+        (255, 354, 151, 200), (355, 424, 201, 300), (425, 604, 301, 500),
+    )),
+    Pollutant("o3", "o3", "ppb", 0, (
+        (0, 54, 0, 50), (55, 70, 51, 100), (71, 85, 101, 150),
+        (86, 105, 151, 200), (106, 200, 201, 300),
+    ), molecular_weight=48.00, secondary=(
+        (125, 164, 101, 150), (165, 204, 151, 200), (205, 404, 201, 300),
+        (405, 504, 301, 400), (505, 604, 401, 500),
+    )),
+    Pollutant("no2", "no2", "ppb", 0, (
+        (0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150),
+        (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 500),
+    ), molecular_weight=46.01),
+    Pollutant("so2", "so2", "ppb", 0, (
+        (0, 35, 0, 50), (36, 75, 51, 100), (76, 185, 101, 150),
+        (186, 304, 151, 200), (305, 604, 201, 300), (605, 1004, 301, 500),
+    ), molecular_weight=64.07),
+    Pollutant("co", "co", "ppm", 1, (
+        (0.0, 4.4, 0, 50), (4.5, 9.4, 51, 100), (9.5, 12.4, 101, 150),
+        (12.5, 15.4, 151, 200), (15.5, 30.4, 201, 300), (30.5, 50.4, 301, 500),
+    ), molecular_weight=28.01),
+)
+
+CATEGORIES = (
+    (50, "Good"),
+    (100, "Moderate"),
+    (150, "Unhealthy for Sensitive Groups"),
+    (200, "Unhealthy"),
+    (300, "Very Unhealthy"),
+    (AQI_MAX, "Hazardous"),
+)
+
+
+def category(aqi: float) -> str:
+    for upper, name in CATEGORIES:
+        if aqi <= upper:
+            return name
+    return CATEGORIES[-1][1]
+
+
+def _interpolate(breakpoints: Breakpoints, c_his: Sequence[float], c: float, above: int) -> int:
+    i = bisect_left(c_his, c)
+    if i == len(breakpoints):
+        return above
+    c_lo, c_hi, i_lo, i_hi = breakpoints[i]
+    c = max(c, c_lo)
+    return round((i_hi - i_lo) / (c_hi - c_lo) * (c - c_lo) + i_lo)
+
+
+def sub_index(pollutant: Pollutant, ugm3: Optional[float]) -> Optional[int]:
+    """EPA sub-index for one pollutant, or None when there's no reading"""
+    if ugm3 is None or ugm3 < 0 or math.isnan(ugm3):
+        return None
+    scale = 10 ** pollutant.decimals
+    c = math.floor(pollutant.convert(ugm3) * scale) / scale
+    result = _interpolate(pollutant.breakpoints, pollutant.c_hi, c, pollutant.above)
+    if pollutant.secondary and c >= pollutant.secondary[0][0]:
+        result = max(result, _interpolate(pollutant.secondary, pollutant.secondary_c_hi, c, AQI_MAX))
+    return result
+
+
+def calculate_aqi(components: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Score one reading, e.g. OpenWeatherMap's `list[0].components`.
+    Returns the overall AQI, its category, the dominant pollutant and
+    every pollutant's sub-index.
+    """
+    sub_indices = {}
+    for pollutant in POLLUTANTS:
+        value = components.get(pollutant.component)
+        sub_indices[pollutant.name] = sub_index(pollutant, None if value is None else float(value))
+
+    scored = {name: value for name, value in sub_indices.items() if value is not None}
+    if not scored:
+        return {"aqi": None, "category": None, "dominant_pollutant": None, "sub_indices": sub_indices}
+    dominant = max(scored, key=scored.get)
+    return {
+        "aqi": scored[dominant],
+        "category": category(scored[dominant]),
+        "dominant_pollutant": dominant,
+        "sub_indices": sub_indices,
+    }
+
+
+def _interpolate_array(breakpoints: Breakpoints, c: "np.ndarray", above: int) -> "np.ndarray":
+    table = np.asarray(breakpoints, dtype=float)
+    i = np.searchsorted(table[:, 1], c, side="left")
+    beyond = i >= len(table)
+    i = np.minimum(i, len(table) - 1)
+    c_lo, c_hi, i_lo, i_hi = (table[i, col] for col in range(4))
+    c = np.maximum(c, c_lo)
+    result = np.rint((i_hi - i_lo) / (c_hi - c_lo) * (c - c_lo) + i_lo)
+    return np.where(beyond, above, result)
+
+
+def _sub_index_array(pollutant: Pollutant, ugm3: "np.ndarray") -> "np.ndarray":
+    scale = 10 ** pollutant.decimals
+    c = np.floor(pollutant.convert(ugm3) * scale) / scale
+    missing = np.isnan(c) | (ugm3 < 0)
+    c = np.where(missing, 0.0, c)
+
+    result = _interpolate_array(pollutant.breakpoints, c, pollutant.above)
+    if pollutant.secondary:
+        secondary = _interpolate_array(pollutant.secondary, c, AQI_MAX)
+        result = np.where(c >= pollutant.secondary[0][0], np.maximum(result, secondary), result)
+    return np.where(missing, np.nan, result)
+
+
+def calculate_aqi_batch(components: Mapping[str, Sequence[float]]) -> Dict[str, Any]:
+    """
+    Score many readings at once, e.g. for backfills. `components` maps
+    OpenWeatherMap component names (pm2_5, pm10, o3, no2, so2, co) to
+    equal-length arrays; missing readings may be NaN. Returns arrays for
+    `aqi` (NaN when nothing was scored), `dominant_pollutant` (None when
+    nothing was scored) and per-pollutant `sub_indices`.
+    """
+    if np is None:
+        raise ImportError("NumPy is required for batch AQI scoring")
+
+    length = None
+    sub_indices = {}
+    for pollutant in POLLUTANTS:
+        if pollutant.component not in components:
+            continue
+        values = np.asarray(components[pollutant.component], dtype=float)
+        if length is None:
+            length = values.shape[0]
+        elif values.shape[0] != length:
+            raise ValueError("All component arrays must have the same length")
+        sub_indices[pollutant.name] = _sub_index_array(pollutant, values)
+
+    if not sub_indices:
+        raise ValueError("No known pollutant components given")
+
+    names = list(sub_indices)
+    stacked = np.vstack([sub_indices[name] for name in names])
+    scored = ~np.isnan(stacked)
+    any_scored = scored.any(axis=0)
+    filled = np.where(scored, stacked, -np.inf)
+    dominant_idx = filled.argmax(axis=0)
+
+    aqi = np.where(any_scored, filled.max(axis=0), np.nan)
+    dominant = np.array(names, dtype=object)[dominant_idx]
+    dominant[~any_scored] = None
+    return {"aqi": aqi, "dominant_pollutant": dominant, "sub_indices": sub_indices}
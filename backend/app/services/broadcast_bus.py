@@ -0,0 +1,184 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Handlers get the published message (a JSON-serialisable dict)
+BusHandler = Callable[[Dict[str, Any]], None]
+
+# Larger messages can't go out as one Unix datagram on common defaults
+MAX_DATAGRAM = 64 * 1024
+
+
+class BroadcastBus:
+    """
+    Fan-out of messages to every worker process on the host, including the
+    publisher. Delivery is best effort and at most once; subscribers must
+    cope with a missed message (WebSocket clients recover with a snapshot).
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[BusHandler]] = {}
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str, handler: BusHandler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def _dispatch(self, topic: str, message: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"Bus handler for {topic} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+class MemoryBus(BroadcastBus):
+    """Single-process bus: publishing calls the local handlers directly"""
+
+    name = "memory"
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        self.published += 1
+        self._dispatch(topic, message)
+
+
+class UnixSocketBus(BroadcastBus):
+    """
+    Bus between the uvicorn workers on one host, with no broker: each worker
+    binds a Unix datagram socket in `directory` and a publish sends one
+    datagram to every other socket there. Sockets left behind by dead
+    workers are removed on the first failed send.
+    """
+
+    name = "unix"
+
+    def __init__(self, directory: str, peer_refresh: float = 1.0):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.peer_refresh = peer_refresh
+        self._sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_checked = 0.0
+
+    def start(self) -> None:
+        if self._sock is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    def stop(self) -> None:
+        if self._sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        except RuntimeError:
+            pass
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self) -> None:
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.received += 1
+            try:
+                envelope = json.loads(data)
+                self._dispatch(envelope["topic"], envelope["message"])
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Dropping malformed bus message: {e}")
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_checked >= self.peer_refresh:
+            self._peers = [
+                path for path in glob.glob(os.path.join(self.directory, "*.sock")) if path != self.path
+            ]
+            self._peers_checked = now
+        return self._peers
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        self.published += 1
+        self._dispatch(topic, message)
+        if self._sock is None:
+            return  # Not started (no event loop yet): local delivery only
+
+        data = json.dumps({"topic": topic, "message": message}).encode()
+        if len(data) > MAX_DATAGRAM:
+            self.dropped += 1
+            logger.warning(f"Bus message on {topic} too large to send ({len(data)} bytes)")
+            return
+        for peer in list(self._peer_paths()):
+            try:
+                self._sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody listening: a worker that exited without cleaning up
+                self._forget_peer(peer)
+            except (BlockingIOError, InterruptedError):
+                self.dropped += 1  # Peer's receive buffer is full
+
+    def _forget_peer(self, peer: str) -> None:
+        if peer in self._peers:
+            self._peers.remove(peer)
+        try:
+            os.unlink(peer)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["peers"] = len(self._peers)
+        return stats
+
+
+def build_bus(kind: str, path: str) -> BroadcastBus:
+    """Bus for WS_BUS_BACKEND ("memory" or "unix")"""
+    if kind in ("", "memory"):
+        return MemoryBus()
+    if kind == "unix":
+        return UnixSocketBus(path)
+    raise ValueError(f"Unknown broadcast bus backend: {kind}")
+
+
+broadcast_bus = build_bus(settings.WS_BUS_BACKEND, settings.WS_BUS_PATH)
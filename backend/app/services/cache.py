@@ -0,0 +1,196 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.cache_backends import SharedCacheBackend, build_shared_backend
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "expires_at", "stored_at")
+
+    def __init__(self, value: Any, fresh_until: float, expires_at: float, stored_at: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.expires_at = expires_at
+        self.stored_at = stored_at
+
+
+class TTLCache:
+    """
+    In-process cache with a per-entry TTL and LRU eviction once
+    `max_entries` is reached. Not thread-safe; meant to be used from
+    the event loop.
+
+    With `stale_ttl` set, entries are kept that much longer after they
+    expire so `get_with_state` can serve them while a refresh runs
+    (stale-while-revalidate). `get` only ever returns fresh values.
+
+    An optional shared `backend` acts as an L2 behind this L1: writes go
+    through to it, and L1 misses (or stale L1 entries) are filled from it
+    when it holds something fresher, so worker processes share fetches.
+    Values must then be JSON serialisable.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 300.0,
+        name: str = "cache",
+        stale_ttl: float = 0.0,
+        backend: Optional[SharedCacheBackend] = None,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.backend = backend
+        self._data: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry.fresh_until > time.monotonic()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_with_state(key, allow_stale=False)[0]
+
+    def get_with_state(
+        self, key: str, allow_stale: bool = True, max_age: Optional[float] = None
+    ) -> Tuple[Optional[Any], bool]:
+        """
+        Return (value, is_fresh). Stale values are returned with False.
+        Entries written more than `max_age` seconds ago count as misses
+        (but are kept), for callers that need a newer reading than that.
+        """
+        entry = self._data.get(key)
+        now = time.monotonic()
+        oldest = now - max_age if max_age is not None else None
+        if entry is not None and entry.expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            entry = None
+        too_old = lambda e: oldest is not None and e.stored_at < oldest
+        if self.backend is not None and (entry is None or entry.fresh_until <= now or too_old(entry)):
+            shared = self._get_shared(key, now)
+            if shared is not None and (entry is None or shared.fresh_until > entry.fresh_until):
+                entry = shared
+                self._store(key, entry)
+        if entry is not None and too_old(entry):
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None, False
+        self._data.move_to_end(key)
+        if entry.fresh_until <= now:
+            if not allow_stale:
+                self.misses += 1
+                return None, False
+            self.stale_hits += 1
+            return entry.value, False
+        self.hits += 1
+        return entry.value, True
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until the entry goes stale (negative once stale), None if absent"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        return entry.fresh_until - time.monotonic()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        self._store(key, CacheEntry(value, now + ttl, now + ttl + self.stale_ttl, now))
+        if self.backend is not None:
+            wall = time.time()
+            try:
+                self.backend.set(key, value, wall + ttl, wall + ttl + self.stale_ttl)
+            except Exception as e:
+                self.l2_errors += 1
+                logger.warning(f"Shared cache write failed for {key}: {e}")
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _get_shared(self, key: str, now: float) -> Optional[CacheEntry]:
+        try:
+            shared = self.backend.get(key)
+        except Exception as e:
+            self.l2_errors += 1
+            logger.warning(f"Shared cache read failed for {key}: {e}")
+            return None
+        if shared is None:
+            self.l2_misses += 1
+            return None
+        self.l2_hits += 1
+        value, fresh_until, expires_at = shared
+        # Shared deadlines are wall-clock; the L1 runs on the monotonic clock
+        offset = now - time.time()
+        # The shared store keeps no write time; assume the default TTL
+        return CacheEntry(value, fresh_until + offset, expires_at + offset, fresh_until + offset - self.ttl)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+        if self.backend is not None:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                self.l2_errors += 1
+                logger.warning(f"Shared cache delete failed for {key}: {e}")
+
+    def clear(self) -> None:
+        """Clear the local L1 only; the shared store belongs to every worker"""
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "l2_backend": self.backend.name if self.backend is not None else None,
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            "l2_errors": self.l2_errors,
+        }
+
+
+# Shared by the REST and WebSocket air-quality paths
+air_quality_cache = TTLCache(
+    max_entries=settings.AIR_QUALITY_CACHE_MAX_ENTRIES,
+    ttl=settings.AIR_QUALITY_CACHE_TTL,
+    name="air_quality",
+    stale_ttl=settings.AIR_QUALITY_CACHE_STALE_TTL,
+    backend=build_shared_backend(
+        settings.AIR_QUALITY_SHARED_CACHE,
+        settings.AIR_QUALITY_SHARED_CACHE_PATH,
+    ),
+)
@@ -0,0 +1,141 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (value, fresh_until, expires_at) with wall-clock (epoch) deadlines, since
+# the entries are shared between processes
+SharedEntry = Tuple[Any, float, float]
+
+
+class SharedCacheBackend:
+    """
+    Cross-process L2 store behind `TTLCache`. Values must be JSON
+    serialisable. Implementations should fail soft: the L1 keeps working
+    if the shared store is unavailable.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[SharedEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(SharedCacheBackend):
+    """Single-process stand-in with the same semantics, for tests and local runs"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, float, float]] = {}
+
+    def get(self, key: str) -> Optional[SharedEntry]:
+        row = self._data.get(key)
+        if row is None:
+            return None
+        if row[2] <= time.time():
+            del self._data[key]
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float) -> None:
+        self._data[key] = (json.dumps(value), fresh_until, expires_at)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SQLiteCacheBackend(SharedCacheBackend):
+    """
+    Shared cache in a local SQLite file (WAL mode), so every uvicorn worker
+    on the host reads the readings the others fetched. Expired rows are
+    purged every `purge_every` writes.
+
+    Calls come from the event loop, so nothing here may block it: reads
+    (which WAL never makes wait for writers) give up after `busy_timeout`
+    seconds and count as a miss, and writes go to one background thread
+    with its own connection, where waiting on other workers is harmless.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, purge_every: int = 500, busy_timeout: float = 0.005):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._writer = sqlite3.connect(path, timeout=1.0, check_same_thread=False, isolation_level=None)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "fresh_until REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache-writer")
+
+    def get(self, key: str) -> Optional[SharedEntry]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, fresh_until, expires_at FROM cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+        except sqlite3.OperationalError as e:
+            # Busy or locked: a miss beats stalling every request on the worker
+            logger.debug(f"Shared cache busy, treating {key} as a miss: {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def _write(self, sql: str, params: Tuple[Any, ...] = ()) -> None:
+        try:
+            self._writer.execute(sql, params)
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._writer.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def set(self, key: str, value: Any, fresh_until: float, expires_at: float) -> None:
+        self._executor.submit(
+            self._write,
+            "INSERT OR REPLACE INTO cache (key, value, fresh_until, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), fresh_until, expires_at),
+        )
+
+    def delete(self, key: str) -> None:
+        self._executor.submit(self._write, "DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._executor.submit(self._write, "DELETE FROM cache")
+
+
+def build_shared_backend(kind: str, path: str) -> Optional[SharedCacheBackend]:
+    """Backend for AIR_QUALITY_SHARED_CACHE ("none", "memory" or "sqlite")"""
+    if kind in ("", "none"):
+        return None
+    if kind == "memory":
+        return MemoryCacheBackend()
+    if kind == "sqlite":
+        return SQLiteCacheBackend(path)
+    raise ValueError(f"Unknown shared cache backend: {kind}")
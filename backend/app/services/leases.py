@@ -0,0 +1,180 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseStore:
+    """
+    Time-limited ownership of named jobs, so that of several workers
+    interested in the same location exactly one does the polling. The
+    owner renews its lease every run; when it stops (or dies) the lease
+    expires and another worker takes over on its next attempt.
+
+    Workers also report their upstream call rate here, so the refresh
+    budget can be held across all of them (`share_rate`).
+    """
+
+    name = "base"
+
+    def __init__(self, owner: str):
+        self.owner = owner
+        self.acquired = 0
+        self.denied = 0
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        """Take or renew the lease on `key`; False if another worker holds it"""
+        raise NotImplementedError
+
+    def release(self, key: str) -> None:
+        raise NotImplementedError
+
+    def share_rate(self, rate: float) -> float:
+        """Report this worker's upstream calls per second; returns the total across workers"""
+        return rate
+
+    def _count(self, granted: bool) -> bool:
+        if granted:
+            self.acquired += 1
+        else:
+            self.denied += 1
+        return granted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "owner": self.owner,
+            "acquired": self.acquired,
+            "denied": self.denied,
+        }
+
+
+class MemoryLeaseStore(LeaseStore):
+    """Leases within one process (every job belongs to the only worker)"""
+
+    name = "memory"
+
+    def __init__(self, owner: str):
+        super().__init__(owner)
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        holder = self._leases.get(key)
+        if holder is not None and holder[0] != self.owner and holder[1] > now:
+            return self._count(False)
+        self._leases[key] = (self.owner, now + ttl)
+        return self._count(True)
+
+    def release(self, key: str) -> None:
+        holder = self._leases.get(key)
+        if holder is not None and holder[0] == self.owner:
+            del self._leases[key]
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """
+    Leases in a SQLite file (WAL mode) shared by the workers on one host.
+    Calls run on the event loop, so a busy database is given only
+    `busy_timeout` seconds: after that `acquire` fails open, `release`
+    leaves the lease to expire and `share_rate` counts only this worker,
+    rather than stalling every connection on the worker.
+
+    A worker's reported rate drops out of the total `rate_ttl` seconds
+    after its last report.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, owner: str, path: str, busy_timeout: float = 0.005, rate_ttl: float = 3600.0):
+        super().__init__(owner)
+        self.path = path
+        self.rate_ttl = rate_ttl
+        self._lock = threading.Lock()
+        # Setup may wait for the other workers starting at the same time
+        self._conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS worker_rates ("
+            "owner TEXT PRIMARY KEY, rate REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"PRAGMA busy_timeout = {max(1, int(busy_timeout * 1000))}")
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        try:
+            with self._lock:
+                # Insert, renew our own lease, or take over an expired one, atomically
+                self._conn.execute(
+                    "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                    (key, self.owner, now + ttl, now),
+                )
+                row = self._conn.execute("SELECT owner FROM leases WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            # Polling twice beats not polling at all
+            logger.warning(f"Lease store unavailable, polling {key} anyway: {e}")
+            return self._count(True)
+        return self._count(row is not None and row[0] == self.owner)
+
+    def release(self, key: str) -> None:
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not release lease {key}: {e}")
+
+    def share_rate(self, rate: float) -> float:
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO worker_rates (owner, rate, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(owner) DO UPDATE SET rate = excluded.rate, updated_at = excluded.updated_at",
+                    (self.owner, rate, now),
+                )
+                # Workers that stopped reporting (restarted or gone) no longer count
+                self._conn.execute("DELETE FROM worker_rates WHERE updated_at <= ?", (now - self.rate_ttl,))
+                row = self._conn.execute("SELECT SUM(rate) FROM worker_rates").fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Lease store unavailable, budgeting on this worker's rate only: {e}")
+            return rate
+        return row[0] if row[0] is not None else rate
+
+
+def build_lease_store(kind: str, path: str) -> LeaseStore:
+    """Lease store for WS_LEASE_BACKEND ("memory" or "sqlite")"""
+    if kind in ("", "memory"):
+        return MemoryLeaseStore(worker_id())
+    if kind == "sqlite":
+        # Stable locations report once per WS_MAX_INTERVAL at worst
+        return SQLiteLeaseStore(worker_id(), path, rate_ttl=2 * settings.WS_MAX_INTERVAL)
+    raise ValueError(f"Unknown lease backend: {kind}")
+
+
+# Long enough to survive one missed run, short enough to fail over quickly
+LOCATION_LEASE_TTL = 2 * settings.WS_UPDATE_INTERVAL
+
+
+def location_lease_ttl(delay: Optional[float]) -> float:
+    """Lease TTL for a location polled again after `delay` (adaptive delays can exceed the base)"""
+    return max(LOCATION_LEASE_TTL, 2 * delay) if delay else LOCATION_LEASE_TTL
+
+location_leases = build_lease_store(settings.WS_LEASE_BACKEND, settings.WS_LEASE_PATH)
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.models import Location
+
+logger = logging.getLogger(__name__)
+
+# ~1 m; readings this close belong to the same location
+COORDINATE_PRECISION = 5
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def location_identity(city: str, state: str, country: str, lat: float, lon: float) -> str:
+    """
+    Key for `Location.identity_key`: case- and whitespace-insensitive names
+    plus rounded coordinates, hashed to a fixed-width column. Exact float
+    equality on five unindexed columns is what it replaces.
+    """
+    # + 0.0 turns -0.0 into 0.0
+    lat = round(lat, COORDINATE_PRECISION) + 0.0
+    lon = round(lon, COORDINATE_PRECISION) + 0.0
+    identity = "|".join((
+        _normalize(country),
+        _normalize(state),
+        _normalize(city),
+        f"{lat:.{COORDINATE_PRECISION}f}",
+        f"{lon:.{COORDINATE_PRECISION}f}",
+    ))
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+class LocationResolver:
+    """
+    Location identity -> `Location.id`. Hits come from an in-process LRU
+    without touching the database; a miss is a single upsert on the unique
+    `identity_key`, so concurrent requests for a new location (in this or
+    another worker) end up with the same row instead of duplicates.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    async def resolve(self, db: AsyncSession, city: str, state: str, country: str, lat: float, lon: float) -> int:
+        key = location_identity(city, state, country, lat, lon)
+        location_id = self._ids.get(key)
+        if location_id is not None:
+            self._ids.move_to_end(key)
+            self.hits += 1
+            return location_id
+        self.misses += 1
+        location_id = await self._upsert(db, dict(
+            city=city,
+            state=state,
+            country=country,
+            latitude=lat,
+            longitude=lon,
+            identity_key=key,
+        ))
+        self._ids[key] = location_id
+        while len(self._ids) > self.max_entries:
+            self._ids.popitem(last=False)
+        return location_id
+
+    async def _upsert(self, db: AsyncSession, values: Dict[str, Any]) -> int:
+        """Insert the location unless it exists; either way return its id"""
+        table = Location.__table__
+        dialect = db.bind.dialect.name
+        if dialect in ("mysql", "mariadb"):
+            # LAST_INSERT_ID(id) makes lastrowid the existing row's id on a duplicate
+            stmt = mysql_insert(table).values(**values)
+            stmt = stmt.on_duplicate_key_update(id=func.last_insert_id(table.c.id))
+            result = await db.execute(stmt)
+            location_id = result.lastrowid
+        elif dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            stmt = insert(table).values(**values)
+            # A no-op update rather than DO NOTHING, so RETURNING also covers existing rows
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.identity_key],
+                set_={"identity_key": stmt.excluded.identity_key},
+            ).returning(table.c.id)
+            location_id = (await db.execute(stmt)).scalar_one()
+        else:
+            result = await db.execute(select(table.c.id).where(table.c.identity_key == values["identity_key"]))
+            location_id = result.scalar()
+            if location_id is None:
+                location_id = (await db.execute(table.insert().values(**values))).inserted_primary_key[0]
+        await db.commit()
+        return location_id
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+location_resolver = LocationResolver(max_entries=settings.LOCATION_CACHE_MAX_ENTRIES)
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.http_client import get_http_client
+
+
+class AirQualityProvider:
+    """
+    Source of raw upstream air-quality responses in OpenWeatherMap's
+    `air_pollution` format. Providers return the `httpx.Response` so the
+    upstream governor can see status codes and `Retry-After` headers
+    regardless of where the response came from.
+    """
+
+    name = "base"
+
+    async def fetch(self, lat: float, lon: float) -> httpx.Response:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class OpenWeatherMapProvider(AirQualityProvider):
+    name = "openweathermap"
+
+    def __init__(self, api_key: str, base_url: str):
+        self.api_key = api_key
+        self.base_url = base_url
+
+    async def fetch(self, lat: float, lon: float) -> httpx.Response:
+        client = get_http_client()
+        return await client.get(
+            self.base_url,
+            params={"lat": lat, "lon": lon, "appid": self.api_key}
+        )
+
+
+def _owm_aqi_index(pm25: float) -> int:
+    """OpenWeatherMap's 1-5 index, driven by PM2.5 here"""
+    for index, limit in enumerate((10, 25, 50, 75), start=1):
+        if pm25 < limit:
+            return index
+    return 5
+
+
+class FakeProvider(AirQualityProvider):
+    """
+    In-process stand-in for OpenWeatherMap. Produces realistic
+    `list[0].components` payloads (stable per location, with a diurnal
+    cycle and noise) after a log-normal latency, and injects 429s, 5xx
+    and timeouts at the configured rates. Pass `seed` for reproducible runs.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = 80.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.latency_ms / 1000 * math.exp(self._random.gauss(0, self.latency_sigma))
+
+    def payload(self, lat: float, lon: float, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        digest = hashlib.sha1(f"{lat:.2f},{lon:.2f}".encode()).digest()
+        # Location baseline between ~0.3x and ~3x typical urban levels
+        base = 0.3 + 2.7 * digest[0] / 255
+        hour = (now / 3600 + lon / 15) % 24  # rough local solar time
+        diurnal = 1 + 0.35 * math.sin((hour - 8) / 24 * 2 * math.pi)
+
+        def level(typical: float) -> float:
+            value = typical * base * diurnal * self._random.uniform(0.85, 1.15)
+            return round(max(value, 0.0), 2)
+
+        components = {
+            "co": level(300.0),
+            "no": level(1.5),
+            "no2": level(20.0),
+            "o3": level(60.0),
+            "so2": level(5.0),
+            "pm2_5": level(12.0),
+            "pm10": level(25.0),
+            "nh3": level(2.0),
+        }
+        return {
+            "coord": {"lon": lon, "lat": lat},
+            "list": [{
+                "main": {"aqi": _owm_aqi_index(components["pm2_5"])},
+                "components": components,
+                "dt": int(now),
+            }],
+        }
+
+    async def fetch(self, lat: float, lon: float) -> httpx.Response:
+        self.calls += 1
+        request = httpx.Request("GET", "http://fake-upstream/air_pollution", params={"lat": lat, "lon": lon})
+        await asyncio.sleep(self._latency())
+
+        roll = self._random.random()
+        if roll < self.timeout_rate:
+            raise httpx.ReadTimeout("Fake upstream timed out", request=request)
+        roll -= self.timeout_rate
+        if roll < self.rate_limit_rate:
+            return httpx.Response(429, headers={"Retry-After": "1"}, request=request)
+        roll -= self.rate_limit_rate
+        if roll < self.error_rate:
+            return httpx.Response(503, request=request)
+        return httpx.Response(200, json=self.payload(lat, lon), request=request)
+
+
+class RecordReplayProvider(AirQualityProvider):
+    """
+    File-backed provider. In "record" mode every response from `upstream`
+    is appended as one JSON line to a file per location under `directory`
+    (off the event loop); in "replay" mode those responses are played back
+    in order (cycling), so runs are reproducible and need no network.
+    Unrecorded locations replay as 404.
+    """
+
+    def __init__(self, directory: str, mode: str = "replay", upstream: Optional[AirQualityProvider] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        if mode == "record" and upstream is None:
+            raise ValueError("Record mode needs an upstream provider")
+        self.directory = directory
+        self.mode = mode
+        self.name = mode
+        self.upstream = upstream
+        self._recordings: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, lat: float, lon: float) -> str:
+        return os.path.join(self.directory, f"{lat:.4f}_{lon:.4f}.jsonl")
+
+    def _load(self, path: str) -> List[Dict[str, Any]]:
+        if path not in self._recordings:
+            try:
+                with open(path) as f:
+                    self._recordings[path] = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                self._recordings[path] = []
+        return self._recordings[path]
+
+    @staticmethod
+    def _append(path: str, line: str) -> None:
+        with open(path, "a") as f:
+            f.write(line)
+
+    async def fetch(self, lat: float, lon: float) -> httpx.Response:
+        path = self._path(lat, lon)
+
+        if self.mode == "record":
+            response = await self.upstream.fetch(lat, lon)
+            recorded = {
+                "status": response.status_code,
+                "headers": {k: v for k, v in response.headers.items() if k.lower() == "retry-after"},
+                "body": response.text,
+            }
+            await asyncio.to_thread(self._append, path, json.dumps(recorded) + "\n")
+            return response
+
+        request = httpx.Request("GET", f"http://replay/{os.path.basename(path)}")
+        recordings = self._load(path)
+        if not recordings:
+            return httpx.Response(404, request=request)
+        position = self._positions.get(path, 0)
+        self._positions[path] = (position + 1) % len(recordings)
+        recorded = recordings[position]
+        return httpx.Response(
+            recorded["status"],
+            headers=recorded.get("headers", {}),
+            content=recorded["body"].encode(),
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+
+def build_provider() -> AirQualityProvider:
+    """Build the provider selected by AIR_QUALITY_PROVIDER"""
+    kind = settings.AIR_QUALITY_PROVIDER
+    if kind == "openweathermap":
+        return OpenWeatherMapProvider(settings.AIR_QUALITY_API_KEY, settings.AIR_QUALITY_API_URL)
+    if kind == "fake":
+        return FakeProvider(
+            latency_ms=settings.AIR_QUALITY_FAKE_LATENCY_MS,
+            latency_sigma=settings.AIR_QUALITY_FAKE_LATENCY_SIGMA,
+            error_rate=settings.AIR_QUALITY_FAKE_ERROR_RATE,
+            rate_limit_rate=settings.AIR_QUALITY_FAKE_RATE_LIMIT_RATE,
+            timeout_rate=settings.AIR_QUALITY_FAKE_TIMEOUT_RATE,
+            seed=settings.AIR_QUALITY_FAKE_SEED,
+        )
+    if kind == "record":
+        upstream = OpenWeatherMapProvider(settings.AIR_QUALITY_API_KEY, settings.AIR_QUALITY_API_URL)
+        return RecordReplayProvider(settings.AIR_QUALITY_RECORDINGS_DIR, "record", upstream=upstream)
+    if kind == "replay":
+        return RecordReplayProvider(settings.AIR_QUALITY_RECORDINGS_DIR, "replay")
+    raise ValueError(f"Unknown air quality provider: {kind}")
+
+
+air_quality_provider = build_provider()
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from app.services.cache import TTLCache, air_quality_cache
+from app.services.providers import AirQualityProvider, air_quality_provider
+from app.services.refresher import BackgroundRefresher, air_quality_refresher
+from app.services.singleflight import SingleFlight, air_quality_flights
+from app.services.spatial import GridCell
+from app.services.upstream_governor import UpstreamGovernor, air_quality_governor
+
+
+class CellReadings:
+    """
+    Raw provider readings per grid cell, shared by the REST and WebSocket
+    air-quality paths: whichever path asks, a cell has one cache entry,
+    one in-flight fetch and one popularity record. The provider payload is
+    cached as-is (a plain dict, so it can be shared across workers) and
+    each path shapes it after the read.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[TTLCache] = None,
+        flights: Optional[SingleFlight] = None,
+        refresher: Optional[BackgroundRefresher] = None,
+        governor: Optional[UpstreamGovernor] = None,
+        provider: Optional[AirQualityProvider] = None,
+    ):
+        self.provider = provider if provider is not None else air_quality_provider
+        self._cache = cache if cache is not None else air_quality_cache
+        self._flights = flights if flights is not None else air_quality_flights
+        self._refresher = refresher if refresher is not None else air_quality_refresher
+        self._governor = governor if governor is not None else air_quality_governor
+
+    def cache_key(self, cell: GridCell) -> str:
+        return f"owm:{cell.key}"
+
+    async def get(
+        self,
+        cell: GridCell,
+        max_age: Optional[float] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ) -> Dict[str, Any]:
+        """
+        The cell's latest provider payload. Stale entries are served while a
+        background refresh runs; with `max_age`, one written longer ago than
+        that is fetched again. A fetch that is needed waits for `semaphore`
+        (when given), and upstream errors are raised to every waiter.
+        """
+        cache_key = self.cache_key(cell)
+        fetch = lambda: self._fetch(cell, cache_key)
+        self._refresher.track(cache_key, fetch)
+        data, fresh = self._cache.get_with_state(cache_key, max_age=max_age)
+        if data is not None and not fresh:
+            self._refresher.refresh_soon(cache_key, fetch)
+        elif data is None:
+            # Concurrent misses for the same cell share one upstream request
+            if semaphore is None:
+                data = await self._flights.do(cache_key, fetch)
+            else:
+                async with semaphore:
+                    data = await self._flights.do(cache_key, fetch)
+        return data
+
+    async def _fetch(self, cell: GridCell, cache_key: str) -> Dict[str, Any]:
+        # Fetched at the cell's centroid, within the upstream quota
+        response = await self._governor.request(lambda: self.provider.fetch(cell.lat, cell.lon))
+        response.raise_for_status()
+        data = response.json()
+        if data.get('list'):
+            self._cache.set(cache_key, data)  # Empty readings are not worth keeping
+        return data
+
+
+cell_readings = CellReadings()
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.cache import TTLCache, air_quality_cache
+from app.services.singleflight import SingleFlight, air_quality_flights
+from app.services.upstream_governor import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+RefreshFn = Callable[[], Awaitable[Any]]
+
+
+class PopularityTracker:
+    """
+    Request counts per cache key with exponential decay, so the top-N list
+    follows what is popular now rather than all-time. Tracks at most
+    `max_keys` keys, dropping the least recently requested.
+    """
+
+    def __init__(self, max_keys: int = 10000, decay: float = 0.5):
+        self.max_keys = max_keys
+        self.decay = decay
+        self._scores: "OrderedDict[str, float]" = OrderedDict()
+        self._refreshers: Dict[str, RefreshFn] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def record(self, key: str, refresh: RefreshFn) -> None:
+        self._scores[key] = self._scores.get(key, 0.0) + 1.0
+        self._scores.move_to_end(key)
+        self._refreshers[key] = refresh
+        while len(self._scores) > self.max_keys:
+            old_key, _ = self._scores.popitem(last=False)
+            self._refreshers.pop(old_key, None)
+
+    def top(self, n: int) -> List[str]:
+        return heapq.nlargest(n, self._scores, key=self._scores.__getitem__)
+
+    def refresher_for(self, key: str) -> Optional[RefreshFn]:
+        return self._refreshers.get(key)
+
+    def apply_decay(self) -> None:
+        for key in list(self._scores):
+            score = self._scores[key] * self.decay
+            if score < 0.01:
+                del self._scores[key]
+                self._refreshers.pop(key, None)
+            else:
+                self._scores[key] = score
+
+
+class BackgroundRefresher:
+    """
+    Stale-while-revalidate support. `refresh_soon` refreshes a key in the
+    background (deduplicated through the single-flight table), and the
+    periodic loop re-fetches the top-N popular keys shortly before they
+    go stale, so hot locations are never served from a cold cache.
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        flights: SingleFlight,
+        tracker: Optional[PopularityTracker] = None,
+        top_n: int = 100,
+        interval: float = 30.0,
+        refresh_ahead: float = 60.0,
+    ):
+        self.cache = cache
+        self.flights = flights
+        self.tracker = tracker if tracker is not None else PopularityTracker()
+        self.top_n = top_n
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+        self._loop_task: Optional["asyncio.Task[Any]"] = None
+        self.background_refreshes = 0
+        self.proactive_refreshes = 0
+        self.refresh_errors = 0
+
+    def track(self, key: str, refresh: RefreshFn) -> None:
+        self.tracker.record(key, refresh)
+
+    def refresh_soon(self, key: str, refresh: RefreshFn) -> None:
+        if key in self.flights:
+            return
+        self.background_refreshes += 1
+        self._spawn(key, refresh)
+
+    def _spawn(self, key: str, refresh: RefreshFn) -> None:
+        task = asyncio.ensure_future(self._refresh(key, refresh))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: str, refresh: RefreshFn) -> None:
+        try:
+            await self.flights.do(key, refresh)
+        except UpstreamUnavailable as e:
+            # Expected during outages/backoff; the stale entry keeps being served
+            logger.debug(f"Background refresh skipped for {key}: {e}")
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh failed for {key}: {e}")
+
+    def refresh_popular(self) -> int:
+        """Refresh top-N keys that are missing or about to go stale"""
+        refreshed = 0
+        for key in self.tracker.top(self.top_n):
+            remaining = self.cache.ttl_remaining(key)
+            if remaining is not None and remaining > self.refresh_ahead:
+                continue
+            refresh = self.tracker.refresher_for(key)
+            if refresh is None or key in self.flights:
+                continue
+            self._spawn(key, refresh)
+            refreshed += 1
+        self.proactive_refreshes += refreshed
+        self.tracker.apply_decay()
+        return refreshed
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.refresh_popular()
+            except Exception as e:
+                logger.error(f"Error in popular location refresh: {e}")
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self.tracker),
+            "pending": len(self._tasks),
+            "background_refreshes": self.background_refreshes,
+            "proactive_refreshes": self.proactive_refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+air_quality_refresher = BackgroundRefresher(
+    air_quality_cache,
+    air_quality_flights,
+    top_n=settings.AIR_QUALITY_REFRESH_TOP_N,
+    interval=settings.AIR_QUALITY_REFRESH_INTERVAL,
+    refresh_ahead=settings.AIR_QUALITY_REFRESH_AHEAD,
+)
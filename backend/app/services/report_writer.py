@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import AirQualityReport
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+# A queued row, whether its writer needs the id back, and its future
+Pending = Tuple[Row, bool, "asyncio.Future[Optional[int]]"]
+
+
+class BatchWriter:
+    """
+    Write-behind buffer for inserts into one table. Rows queue up in memory
+    and go out as one multi-row INSERT and one COMMIT per batch, instead of
+    a round trip and a commit per row.
+
+    `write` returns the row's id once it is committed. Its row is flushed
+    at once, and rows that arrive while a flush is in flight go out
+    together in the next one, so a lone writer pays no batching delay and
+    a busy one gets large batches. `submit` returns the future without
+    waiting, and its rows are flushed when `batch_size` rows are pending or
+    `interval` seconds after the first. On MySQL (no RETURNING) ids come
+    from the batch INSERT's first generated id. If a batch fails, its rows
+    are retried one at a time so only the offending row's future fails.
+
+    At most `max_pending` rows are held, after which submitters wait for
+    the next flush. `stop` flushes whatever is still queued, so a clean
+    shutdown loses nothing.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        session_factory: Callable[[], AsyncSession],
+        batch_size: int = 500,
+        interval: float = 0.5,
+        max_pending: int = 10000,
+    ):
+        if batch_size <= 0 or max_pending < batch_size:
+            raise ValueError("batch_size must be positive and no larger than max_pending")
+        self.model = model
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: List[Pending] = []
+        self._has_rows = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._loop_task: Optional["asyncio.Task[Any]"] = None
+        self._stopping = False
+        self._id_step: Optional[int] = None  # MySQL auto_increment_increment
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.max_pending_seen = 0
+        self.last_batch_size = 0
+        self.last_flush_duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, row: Row, with_id: bool = False) -> "asyncio.Future[Optional[int]]":
+        """Queue `row`; the future resolves once it is committed, to its id if `with_id` (else maybe None)"""
+        while len(self._pending) >= self.max_pending:
+            self._space.clear()
+            await self._space.wait()
+        future: "asyncio.Future[Optional[int]]" = asyncio.get_running_loop().create_future()
+        self._pending.append((row, with_id, future))
+        self.max_pending_seen = max(self.max_pending_seen, len(self._pending))
+        self._has_rows.set()
+        if with_id or len(self._pending) >= self.batch_size:
+            self._flush_now.set()  # Someone is waiting on it, or the batch is full
+        if self._loop_task is None:
+            # Not started (scripts, tests) or already stopped: write through
+            await self.flush()
+        return future
+
+    async def write(self, row: Row) -> Optional[int]:
+        """Queue `row` and wait until it is committed; returns its id"""
+        return await (await self.submit(row, with_id=True))
+
+    async def flush(self) -> None:
+        """Write everything queued so far, `batch_size` rows per statement"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+                if not self._pending:
+                    self._has_rows.clear()
+                    self._flush_now.clear()
+                self._space.set()
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[Pending]) -> None:
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                ids = await self._insert(db, batch)
+                await db.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                # Find the bad row(s) instead of failing everyone queued with them
+                logger.warning(
+                    f"Batch of {len(batch)} {self.model.__tablename__} rows failed ({e}), retrying row by row"
+                )
+                for item in batch:
+                    await self._write_batch([item])
+                return
+            self.rows_failed += 1
+            logger.error(f"Error writing {self.model.__tablename__} row: {e}")
+            future = batch[0][2]
+            if not future.done():
+                future.set_exception(e)
+            return
+        finally:
+            self.last_flush_duration = time.perf_counter() - started
+        self.batches += 1
+        self.rows_written += len(batch)
+        self.last_batch_size = len(batch)
+        for (_, _, future), row_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(row_id)
+
+    async def _insert(self, db: AsyncSession, batch: List[Pending]) -> List[Optional[int]]:
+        """Insert `batch` in the session's transaction; returns ids in batch order"""
+        stmt = insert(self.model)
+        if db.bind.dialect.insert_executemany_returning_sort_by_parameter_order:
+            result = await db.execute(
+                stmt.returning(self.model.id, sort_by_parameter_order=True), [row for row, _, _ in batch]
+            )
+            return list(result.scalars())
+        if db.bind.dialect.name == "mysql":
+            return await self._insert_mysql(db, batch)
+        # Other dialects without RETURNING: rows whose id is wanted go one
+        # per INSERT (for lastrowid) and the rest share one executemany
+        ids: List[Optional[int]] = [None] * len(batch)
+        bulk = []
+        for i, (row, with_id, _) in enumerate(batch):
+            if with_id:
+                result = await db.execute(stmt.values(**row))
+                ids[i] = result.inserted_primary_key[0]
+            else:
+                bulk.append(row)
+        if bulk:
+            await db.execute(stmt, bulk)
+        return ids
+
+    async def _insert_mysql(self, db: AsyncSession, batch: List[Pending]) -> List[Optional[int]]:
+        # One multi-row INSERT; LAST_INSERT_ID() is the first row's id. InnoDB
+        # allocates a multi-row VALUES insert's ids in one block (in every
+        # innodb_autoinc_lock_mode), so the rest follow at auto_increment_increment
+        if self._id_step is None:
+            self._id_step = (await db.execute(text("SELECT @@auto_increment_increment"))).scalar_one()
+        result = await db.execute(insert(self.model.__table__).values([row for row, _, _ in batch]))
+        first_id = result.lastrowid
+        return [first_id + i * self._id_step for i in range(len(batch))]
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._has_rows.wait()
+            if len(self._pending) < self.batch_size and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in {self.model.__tablename__} write-behind loop: {e}")
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._stopping = False
+            self._loop_task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop, then write out everything still queued"""
+        if self._loop_task is not None:
+            self._stopping = True
+            self._has_rows.set()
+            self._flush_now.set()
+            await self._loop_task
+            self._loop_task = None
+            self._stopping = False
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "max_pending_seen": self.max_pending_seen,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_duration": self.last_flush_duration,
+        }
+
+
+report_writer = BatchWriter(
+    AirQualityReport,
+    AsyncSessionLocal,
+    batch_size=settings.REPORT_WRITE_BATCH_SIZE,
+    interval=settings.REPORT_WRITE_INTERVAL,
+    max_pending=settings.REPORT_WRITE_MAX_PENDING,
+)
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A job callback may return a delay (seconds) to override its next interval
+JobCallback = Callable[[], Awaitable[Optional[float]]]
+
+
+class ScheduledJob:
+    __slots__ = (
+        "key", "interval", "callback", "timeout", "due", "running",
+        "runs", "failures", "timeouts", "last_duration", "next_delay", "last_lag", "last_finished",
+    )
+
+    def __init__(self, key: str, interval: float, callback: JobCallback, timeout: Optional[float] = None):
+        self.key = key
+        self.interval = interval
+        self.callback = callback
+        self.timeout = timeout
+        self.due = 0.0
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.last_duration = 0.0
+        self.next_delay = interval
+        self.last_lag = 0.0  # How late the current (or last) run started
+        self.last_finished: Optional[float] = None  # time.monotonic() when the last run ended
+
+
+class RefreshScheduler:
+    """
+    One heap of refresh deadlines for every periodic job in the worker,
+    instead of one sleeping coroutine per client or location. A single
+    dispatcher task pops due jobs onto a ready queue drained by a fixed
+    pool of `max_concurrency` workers, so task count stays flat no matter
+    how many jobs exist. Due times get +/- `jitter` (a fraction of the
+    interval) to spread out refreshes that were scheduled together.
+
+    A run that exceeds `timeout` is cancelled so it can't hold a worker;
+    failed and timed-out jobs are retried after `retry_delay` (when set)
+    instead of a full interval.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 50,
+        jitter: float = 0.1,
+        name: str = "scheduler",
+        timeout: Optional[float] = None,
+        retry_delay: Optional[float] = None,
+    ):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be positive")
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._heap: List[Tuple[float, int, ScheduledJob]] = []
+        self._seq = itertools.count()
+        self._ready: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._random = random.Random()
+        self._active = 0
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.max_lag = 0.0
+        self.last_duration = 0.0
+        self.avg_duration = 0.0
+        self.max_duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._jobs
+
+    def schedule(
+        self,
+        key: str,
+        interval: float,
+        callback: JobCallback,
+        first_delay: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Add (or replace) a periodic job; its first run is after `first_delay`.
+        `timeout` overrides the scheduler's default run timeout.
+        """
+        job = ScheduledJob(key, interval, callback, timeout if timeout is not None else self.timeout)
+        self._jobs[key] = job
+        self._push(job, first_delay)
+        self.start()
+
+    def cancel(self, key: str) -> None:
+        # Heap entries for the job become stale and are skipped when popped
+        self._jobs.pop(key, None)
+
+    def _push(self, job: ScheduledJob, delay: float) -> None:
+        job.due = time.monotonic() + max(delay, 0.0)
+        heapq.heappush(self._heap, (job.due, next(self._seq), job))
+        if self._wakeup is not None and self._heap[0][2] is job:
+            self._wakeup.set()
+
+    def _jittered(self, delay: float) -> float:
+        if not self.jitter:
+            return delay
+        return delay * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _is_current(self, due: float, job: ScheduledJob) -> bool:
+        return self._jobs.get(job.key) is job and job.due == due and not job.running
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Started later, from inside the event loop
+        self._ready = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        for _ in range(self.max_concurrency):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._ready = None
+        self._wakeup = None
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                if self._is_current(due, job):
+                    job.running = True
+                    self._ready.put_nowait(job)
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._ready.get()
+            if self._jobs.get(job.key) is not job:
+                job.running = False
+                continue  # Cancelled while queued
+            started = time.monotonic()
+            job.last_lag = started - job.due
+            self.max_lag = max(self.max_lag, job.last_lag)
+            next_delay = None
+            self._active += 1
+            try:
+                next_delay = await asyncio.wait_for(job.callback(), job.timeout)
+                job.runs += 1
+                self.runs += 1
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                job.timeouts += 1
+                self.timeouts += 1
+                next_delay = self.retry_delay
+                logger.warning(f"Scheduled job {job.key} timed out after {job.timeout}s")
+            except Exception as e:
+                job.failures += 1
+                self.failures += 1
+                next_delay = self.retry_delay
+                logger.error(f"Scheduled job {job.key} failed: {e}")
+            finally:
+                job.running = False
+                self._active -= 1
+                job.last_finished = time.monotonic()
+                self._record_duration(job, job.last_finished - started)
+            if self._jobs.get(job.key) is job:
+                job.next_delay = job.interval if next_delay is None else next_delay
+                self._push(job, self._jittered(job.next_delay))
+
+    def _record_duration(self, job: ScheduledJob, duration: float) -> None:
+        job.last_duration = duration
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        # Exponentially weighted, so it follows the current upstream latency
+        self.avg_duration = duration if not self.avg_duration else 0.9 * self.avg_duration + 0.1 * duration
+
+    def effective_interval(self, key: str) -> Optional[float]:
+        """Delay (before jitter) the job asked for after its last run"""
+        job = self._jobs.get(key)
+        return job.next_delay if job is not None else None
+
+    def lateness(self, key: str) -> Optional[float]:
+        """How long after its due time the job's current (or last) run started"""
+        job = self._jobs.get(key)
+        return job.last_lag if job is not None else None
+
+    def since_last_run(self, key: str) -> Optional[float]:
+        """Seconds since the job's previous run ended; None before its first"""
+        job = self._jobs.get(key)
+        if job is None or job.last_finished is None:
+            return None
+        return time.monotonic() - job.last_finished
+
+    def intervals(self) -> Dict[str, float]:
+        return {key: job.next_delay for key, job in self._jobs.items()}
+
+    def lag(self) -> float:
+        """How far behind schedule the most overdue job is right now"""
+        if not self._heap:
+            return 0.0
+        return max(0.0, time.monotonic() - self._heap[0][0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "jobs": len(self._jobs),
+            "heap": len(self._heap),
+            "ready": self._ready.qsize() if self._ready is not None else 0,
+            "running": self._active,
+            "max_concurrency": self.max_concurrency,
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "lag": self.lag(),
+            "max_lag": self.max_lag,
+            "last_duration": self.last_duration,
+            "avg_duration": self.avg_duration,
+            "max_duration": self.max_duration,
+        }
+
+
+refresh_scheduler = RefreshScheduler(
+    max_concurrency=settings.WS_REFRESH_CONCURRENCY,
+    jitter=settings.WS_REFRESH_JITTER,
+    name="ws_refresh",
+    timeout=settings.WS_REFRESH_TIMEOUT,
+    retry_delay=settings.WS_RETRY_INTERVAL,
+)
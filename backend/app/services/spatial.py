@@ -0,0 +1,109 @@
+import math
+from typing import Any, Dict, Tuple
+
+from app.core.config import settings
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_GEOHASH_INDEX = {c: i for i, c in enumerate(_GEOHASH_BASE32)}
+
+
+class GridCell:
+    """A spatial bucket: its stable key and the centroid readings are fetched for"""
+
+    __slots__ = ("key", "lat", "lon")
+
+    def __init__(self, key: str, lat: float, lon: float):
+        self.key = key
+        self.lat = lat
+        self.lon = lon
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"key": self.key, "lat": self.lat, "lon": self.lon}
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def geohash_decode(geohash: str) -> Tuple[float, float]:
+    """Return the centre of the geohash cell as (lat, lon)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _GEOHASH_INDEX[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class SpatialGrid:
+    """
+    Buckets coordinates so nearby requests share cache entries, upstream
+    calls and WebSocket subscriptions.
+
+    mode="grid" uses a fixed lat/lon grid with `degrees`-sized cells;
+    mode="geohash" uses geohash cells of `geohash_precision` characters.
+    """
+
+    def __init__(self, mode: str = "grid", degrees: float = 0.05, geohash_precision: int = 5):
+        if mode not in ("grid", "geohash"):
+            raise ValueError(f"Unknown spatial grid mode: {mode}")
+        if mode == "grid" and degrees <= 0:
+            raise ValueError("Grid cell size must be positive")
+        if mode == "geohash" and not 1 <= geohash_precision <= 12:
+            raise ValueError("Geohash precision must be between 1 and 12")
+        self.mode = mode
+        self.degrees = degrees
+        self.geohash_precision = geohash_precision
+
+    def snap(self, lat: float, lon: float) -> GridCell:
+        if self.mode == "geohash":
+            return self.cell_for_key(geohash_encode(lat, lon, self.geohash_precision))
+        row = math.floor(lat / self.degrees)
+        col = math.floor(lon / self.degrees)
+        return self.cell_for_key(f"{row}:{col}")
+
+    def cell_for_key(self, key: str) -> GridCell:
+        """Rebuild a cell (and its centroid) from a key produced by `snap`"""
+        if self.mode == "geohash":
+            lat, lon = geohash_decode(key)
+        else:
+            row, col = (int(part) for part in key.split(":"))
+            lat = min(max((row + 0.5) * self.degrees, -90.0), 90.0)
+            lon = min(max((col + 0.5) * self.degrees, -180.0), 180.0)
+        return GridCell(key, round(lat, 6), round(lon, 6))
+
+
+air_quality_grid = SpatialGrid(
+    mode=settings.AIR_QUALITY_GRID_MODE,
+    degrees=settings.AIR_QUALITY_GRID_DEGREES,
+    geohash_precision=settings.AIR_QUALITY_GEOHASH_PRECISION,
+)
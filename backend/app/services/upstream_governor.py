@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling upstream when the governor refuses the request"""
+
+
+class TokenBucket:
+    """
+    Token bucket sized to the provider quota. `rate` can be lowered and
+    restored at runtime for adaptive throttling.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, timeout: float = 0.0) -> bool:
+        """Take one token, waiting up to `timeout` seconds for it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "upstream"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.state_changes: Dict[str, int] = {self.CLOSED: 0, self.OPEN: 0, self.HALF_OPEN: 0}
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+        self.state = state
+        self.state_changes[state] += 1
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            # Only one probe request at a time while half-open
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """Give back a half-open probe slot without recording an outcome"""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamGovernor:
+    """
+    Gatekeeper for upstream air-quality calls. Requests need a token from
+    the bucket and a closed (or probing) circuit. A 429 backs everyone off
+    for `Retry-After` (or an exponential default) and halves the bucket
+    rate, which then recovers additively on success. 5xx responses and
+    transport errors count as breaker failures.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        breaker: CircuitBreaker,
+        max_wait: float = 2.0,
+        max_backoff: float = 300.0,
+    ):
+        self.bucket = bucket
+        self.breaker = breaker
+        self.max_wait = max_wait
+        self.max_backoff = max_backoff
+        self._backoff_until = 0.0
+        self._consecutive_429 = 0
+        self.requests = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        if time.monotonic() < self._backoff_until:
+            self.rejected += 1
+            raise UpstreamUnavailable("Upstream rate limit backoff in effect")
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable("Upstream circuit is open")
+        if not await self.bucket.acquire(timeout=self.max_wait):
+            self.breaker.release()
+            self.rejected += 1
+            raise UpstreamUnavailable("Upstream request budget exhausted")
+
+        self.requests += 1
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        if response.status_code == 429:
+            self._on_rate_limited(response)
+        elif response.status_code >= 500:
+            self.failures += 1
+            self.breaker.record_failure()
+        else:
+            self._on_success()
+        return response
+
+    def _on_rate_limited(self, response: httpx.Response) -> None:
+        self.rate_limited += 1
+        self._consecutive_429 += 1
+        self.breaker.release()
+        delay = _parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            delay = 2 ** (self._consecutive_429 - 1)
+        delay = min(delay, self.max_backoff)
+        self._backoff_until = time.monotonic() + delay
+        self.bucket.rate = max(self.bucket.base_rate * 0.1, self.bucket.rate / 2)
+        logger.warning(
+            f"Upstream rate limited; backing off {delay:.1f}s, rate now {self.bucket.rate:.2f}/s"
+        )
+
+    def _on_success(self) -> None:
+        self._consecutive_429 = 0
+        self.breaker.record_success()
+        if self.bucket.rate < self.bucket.base_rate:
+            self.bucket.rate = min(
+                self.bucket.base_rate, self.bucket.rate + self.bucket.base_rate * 0.05
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_state_changes": dict(self.breaker.state_changes),
+            "consecutive_failures": self.breaker.failures,
+            "rate": self.bucket.rate,
+            "base_rate": self.bucket.base_rate,
+            "tokens": self.bucket.tokens,
+            "backoff_remaining": max(0.0, self._backoff_until - time.monotonic()),
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+        }
+
+
+air_quality_governor = UpstreamGovernor(
+    TokenBucket(
+        rate=settings.AIR_QUALITY_RATE_LIMIT_PER_SECOND,
+        capacity=settings.AIR_QUALITY_RATE_LIMIT_BURST,
+    ),
+    CircuitBreaker(
+        failure_threshold=settings.AIR_QUALITY_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.AIR_QUALITY_BREAKER_RESET_TIMEOUT,
+        name="air_quality",
+    ),
+    max_wait=settings.AIR_QUALITY_RATE_LIMIT_MAX_WAIT,
+)
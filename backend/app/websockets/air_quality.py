@@ -1,66 +1,220 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Optional
+from fastapi import WebSocket
+from typing import Any, Dict, List, Optional, Set
 from datetime import datetime
 import json
-import asyncio
+import logging
+import time
+from app.core.config import settings
 from app.services.air_quality_service import AirQualityService
+from app.services.broadcast_bus import BroadcastBus, broadcast_bus
+from app.services.leases import LeaseStore, location_lease_ttl, location_leases
+from app.services.adaptive_interval import AdaptiveIntervals, refresh_intervals
+from app.services.scheduler import RefreshScheduler, refresh_scheduler
+from app.services.spatial import SpatialGrid, air_quality_grid
+from app.websockets.deltas import DeltaEncoder, create_delta_encoder
+from app.websockets.sender import ConnectionSender, create_sender
+
+logger = logging.getLogger(__name__)
+
+# A poll starting later than this fraction of its own delay means the worker
+# pool can't keep up
+LATE_FRACTION = 0.25
 
 class AirQualityWebSocket:
-    def __init__(self):
+    # Readings fan out to every worker on the bus; only the lease holder polls
+    topic = "aqws"
+
+    def __init__(
+        self,
+        grid: Optional[SpatialGrid] = None,
+        scheduler: Optional[RefreshScheduler] = None,
+        deltas: Optional[DeltaEncoder] = None,
+        bus: Optional[BroadcastBus] = None,
+        leases: Optional[LeaseStore] = None,
+        intervals: Optional[AdaptiveIntervals] = None,
+    ):
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.senders: Dict[WebSocket, ConnectionSender] = {}
+        self.delta_clients: Set[WebSocket] = set()  # Connections that asked for delta frames
+        self.deltas = deltas if deltas is not None else create_delta_encoder()
+        self._cycle_started: Optional[float] = None
+        self._cycle_pending: Set[str] = set()
+        self.cycles = 0
+        self.last_cycle_duration = 0.0
+        self.last_cycle_locations = 0
+        self.late_polls = 0
         self.air_quality_service = AirQualityService()
-        self.background_task = None
+        self.grid = grid if grid is not None else air_quality_grid
+        self.scheduler = scheduler if scheduler is not None else refresh_scheduler
+        self.leases = leases if leases is not None else location_leases
+        self.intervals = intervals if intervals is not None else refresh_intervals
+        self.bus = bus if bus is not None else broadcast_bus
+        self.bus.subscribe(self.topic, self._on_bus_message)
+
+    def _job_key(self, location_key: str) -> str:
+        return f"aqws:{location_key}"
 
-    async def connect(self, websocket: WebSocket, location_key: str):
+    def location_key(self, lat: float, lon: float) -> str:
+        """Subscription key for a coordinate; nearby clients share one cell"""
+        return self.grid.snap(lat, lon).key
+
+    async def connect(self, websocket: WebSocket, location_key: str, deltas: bool = False):
         await websocket.accept()
+        if deltas and self.deltas.deltas:
+            self.delta_clients.add(websocket)
         if location_key not in self.active_connections:
             self.active_connections[location_key] = []
         self.active_connections[location_key].append(websocket)
+        self.senders[websocket] = create_sender(
+            websocket, on_close=lambda: self.disconnect(websocket, location_key)
+        )
         
-        # Start background task if not running
-        if not self.background_task:
-            self.background_task = asyncio.create_task(self.update_air_quality())
+        # First connection for a location: give it a refresh job on the shared scheduler
+        job_key = self._job_key(location_key)
+        if job_key not in self.scheduler:
+            self.scheduler.schedule(
+                job_key, settings.WS_UPDATE_INTERVAL, lambda: self.update_air_quality(location_key)
+            )
+        else:
+            self.send_snapshot(websocket, location_key)
 
     def disconnect(self, websocket: WebSocket, location_key: str):
-        self.active_connections[location_key].remove(websocket)
-        if not self.active_connections[location_key]:
-            del self.active_connections[location_key]
-        
-        # Stop background task if no connections
-        if not self.active_connections and self.background_task:
-            self.background_task.cancel()
-            self.background_task = None
-
-    async def broadcast_to_location(self, location_key: str, data: dict):
-        if location_key in self.active_connections:
-            dead_connections = []
-            for connection in self.active_connections[location_key]:
-                try:
-                    await connection.send_json(data)
-                except WebSocketDisconnect:
-                    dead_connections.append(connection)
-            
-            # Clean up dead connections
-            for dead in dead_connections:
-                self.active_connections[location_key].remove(dead)
-            if not self.active_connections[location_key]:
-                del self.active_connections[location_key]
-
-    async def update_air_quality(self):
-        """Background task to periodically update air quality data"""
-        while True:
-            try:
-                for location_key in list(self.active_connections.keys()):
-                    lat, lon = map(float, location_key.split(','))
-                    data = await self.air_quality_service.get_air_quality_data(lat, lon)
-                    if data:
-                        await self.broadcast_to_location(location_key, {
-                            'timestamp': datetime.utcnow().isoformat(),
-                            'data': data
-                        })
-                await asyncio.sleep(300)  # Update every 5 minutes
-            except Exception as e:
-                print(f"Error in air quality update: {e}")
-                await asyncio.sleep(60)  # Wait a minute before retrying
+        self.delta_clients.discard(websocket)
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.close()
+        connections = self.active_connections.get(location_key)
+        if connections is None or websocket not in connections:
+            return
+        connections.remove(websocket)
+        if not connections:
+            self._drop_location(location_key)
+
+    def _drop_location(self, location_key: str):
+        del self.active_connections[location_key]
+        self.deltas.drop(location_key)
+        self.scheduler.cancel(self._job_key(location_key))
+        self.leases.release(self._job_key(location_key))
+        self.intervals.drop(self._job_key(location_key))
+
+    def send_snapshot(self, websocket: WebSocket, location_key: str):
+        """Full state of a location, for new or out-of-sync clients"""
+        frame = self.deltas.snapshot(location_key)
+        sender = self.senders.get(websocket)
+        if frame is not None and sender is not None:
+            sender.enqueue(frame)
+
+    def broadcast_to_location(self, location_key: str, data: dict):
+        # Change-only and encoded once for all subscribers. Each connection's
+        # writer sends independently; failed or slow connections are removed
+        # through the sender's on_close callback
+        connections = list(self.active_connections.get(location_key, ()))
+        if not connections:
+            return
+        frame = self.deltas.update(location_key, data)
+        if frame is None:
+            return
+        full_frame = self.deltas.snapshot(location_key)
+        for connection in connections:
+            sender = self.senders.get(connection)
+            if sender is not None:
+                sender.enqueue(frame if connection in self.delta_clients else full_frame)
+
+    async def update_air_quality(self, location_key: str) -> Optional[float]:
+        """
+        Scheduled refresh of one location; returns the adaptive delay until
+        the next one, or a shorter retry delay when the fetch fails.
+        Locations are polled concurrently by the scheduler's worker pool, each
+        run bounded by WS_REFRESH_TIMEOUT.
+        """
+        job_key = self._job_key(location_key)
+        # Every exit counts as this location's poll, so cycles complete on
+        # workers that don't own (or no longer serve) some locations
+        try:
+            if location_key not in self.active_connections:
+                return None
+            self._check_lateness(location_key, job_key)
+            lease_ttl = location_lease_ttl(self.scheduler.effective_interval(job_key))
+            owner = self.leases.acquire(job_key, lease_ttl)
+            if not owner:
+                self.intervals.drop(job_key)  # Another worker's intervals govern this location
+                if location_key in self.deltas:
+                    return None  # Another worker polls this location
+            cell = self.grid.cell_for_key(location_key)
+            # Only a reading fetched since the last poll tells the adaptive
+            # interval anything; an older cached one would read as "unchanged"
+            data = await self.air_quality_service.get_air_quality_data(
+                cell.lat, cell.lon, max_age=self.scheduler.since_last_run(job_key)
+            )
+            if not data:
+                logger.warning(f"No air quality data for location {location_key}")
+                return settings.WS_RETRY_INTERVAL
+            if location_key not in self.active_connections:
+                return None
+            payload = {
+                'timestamp': datetime.utcnow().isoformat(),
+                'data': data
+            }
+            if not owner:
+                self.broadcast_to_location(location_key, payload)
+                return None
+            self.bus.publish(self.topic, {'location': location_key, 'payload': payload})
+            next_delay = self.intervals.next_interval(job_key, aqi=data.get('aqi'), observed_at=data.get('observed_at'))
+            # Hold the lease until past the next poll, however far out it is
+            if location_lease_ttl(next_delay) > lease_ttl:
+                self.leases.acquire(job_key, location_lease_ttl(next_delay))
+            return next_delay
+        finally:
+            self._mark_polled(location_key)
+
+    def _on_bus_message(self, message: Dict[str, Any]):
+        self.broadcast_to_location(message['location'], message['payload'])
+
+    def _check_lateness(self, location_key: str, job_key: str):
+        # Measured against the delay this run was scheduled with, since adaptive
+        # intervals differ per location and from run to run
+        late = self.scheduler.lateness(job_key)
+        delay = self.scheduler.effective_interval(job_key)
+        if late is None or delay is None or late <= delay * LATE_FRACTION:
+            return
+        self.late_polls += 1
+        logger.warning(
+            f"Air quality poll for {location_key} started {late:.1f}s late "
+            f"(scheduled {delay:.0f}s after the last), falling behind"
+        )
+
+    def _mark_polled(self, location_key: str):
+        # A cycle ends once every location present at its start has been polled
+        now = time.monotonic()
+        if self._cycle_started is None:
+            self._start_cycle(now)
+        self._cycle_pending.discard(location_key)
+        self._cycle_pending.intersection_update(self.active_connections)
+        if self._cycle_pending:
+            return
+
+        self.cycles += 1
+        self.last_cycle_duration = now - self._cycle_started
+        logger.info(
+            f"Air quality polling cycle: {self.last_cycle_locations} locations "
+            f"in {self.last_cycle_duration:.1f}s"
+        )
+        self._start_cycle(now)
+
+    def _start_cycle(self, now: float):
+        self._cycle_started = now
+        self._cycle_pending = set(self.active_connections)
+        self.last_cycle_locations = len(self._cycle_pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "locations": len(self.active_connections),
+            "connections": len(self.senders),
+            "cycles": self.cycles,
+            "last_cycle_duration": self.last_cycle_duration,
+            "last_cycle_locations": self.last_cycle_locations,
+            "late_polls": self.late_polls,
+            "updates": self.deltas.stats(),
+        }
 
 air_quality_ws = AirQualityWebSocket()
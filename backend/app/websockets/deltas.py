@@ -0,0 +1,170 @@
+import math
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.config import settings
+from app.websockets.encoding import encode_frame
+
+SNAPSHOT = "air_quality_update"
+DELTA = "air_quality_delta"
+
+
+def flatten(payload: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested dict -> {"data.components.pm2_5": value}; lists are leaf values"""
+    flat = {}
+    for key, value in payload.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def unflatten(flat: Dict[str, Any]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    for path, value in flat.items():
+        node = payload
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return payload
+
+
+class _LocationState:
+    __slots__ = ("epoch", "seq", "values", "frame")
+
+    def __init__(self):
+        # Distinguishes this run of seq numbers from an earlier one for the
+        # same location (or one on another worker)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.values: Dict[str, Any] = {}
+        self.frame: Optional[str] = None  # Encoded snapshot at `seq`
+
+
+class DeltaEncoder:
+    """
+    Remembers the last payload pushed for each location and turns a new
+    payload into the frame that needs to go out, if any:
+
+    - the first payload is a full `air_quality_update` frame
+    - a payload with no field changed beyond the tolerance is skipped
+    - otherwise an `air_quality_delta` frame carries only the changed
+      fields (as dotted paths) and `removed` paths
+
+    Every frame that goes out bumps the location's `seq`. A client that
+    sees a gap (e.g. its send queue dropped a frame) asks for a snapshot,
+    which is the full state at the current `seq`. Numbers count as
+    unchanged within `rel_tol`/`abs_tol` of the last value sent, so slow
+    drift still goes out once it adds up. Fields named in `ignore` (the
+    per-tick timestamps) never trigger a push on their own but ride along
+    with one.
+    """
+
+    def __init__(
+        self,
+        rel_tol: float = 0.0,
+        abs_tol: float = 0.0,
+        deltas: bool = True,
+        ignore: Iterable[str] = ("timestamp",),
+    ):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self.deltas = deltas
+        self.ignore = frozenset(ignore)
+        self._locations: Dict[str, _LocationState] = {}
+        self.snapshots = 0
+        self.deltas_sent = 0
+        self.skipped = 0
+
+    def __contains__(self, location_key: str) -> bool:
+        return location_key in self._locations
+
+    def _same(self, old: Any, new: Any) -> bool:
+        if isinstance(old, bool) or isinstance(new, bool):
+            return old == new
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return math.isclose(old, new, rel_tol=self.rel_tol, abs_tol=self.abs_tol)
+        return old == new
+
+    def _ignored(self, path: str) -> bool:
+        return path.rsplit(".", 1)[-1] in self.ignore
+
+    def update(self, location_key: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Encoded frame to broadcast for a new payload, or None to skip the push"""
+        flat = flatten(payload)
+        state = self._locations.get(location_key)
+        if state is None:
+            state = self._locations[location_key] = _LocationState()
+            state.values = flat
+            state.seq = 1
+            self.snapshots += 1
+            return self._snapshot_frame(state)
+
+        changes = {
+            path: value for path, value in flat.items()
+            if path not in state.values or not self._same(state.values[path], value)
+        }
+        removed = [path for path in state.values if path not in flat]
+        if all(self._ignored(path) for path in changes) and not removed:
+            self.skipped += 1
+            return None
+
+        state.seq += 1
+        state.frame = None
+        # Only what was sent becomes the new baseline, so values inside the
+        # tolerance keep comparing against what clients actually hold
+        state.values.update(changes)
+        for path in removed:
+            del state.values[path]
+        if not self.deltas:
+            self.snapshots += 1
+            return self._snapshot_frame(state)
+
+        self.deltas_sent += 1
+        frame = {'type': DELTA, 'seq': state.seq, 'changes': changes}
+        if removed:
+            frame['removed'] = removed
+        return encode_frame(frame)
+
+    def snapshot(self, location_key: str) -> Optional[str]:
+        """Full frame at the location's current seq, for new or out-of-sync clients"""
+        state = self._locations.get(location_key)
+        if state is None:
+            return None
+        return self._snapshot_frame(state)
+
+    def event_id(self, location_key: str) -> Optional[str]:
+        """Stable id of the location's current state, for SSE `id:` / `Last-Event-ID`"""
+        state = self._locations.get(location_key)
+        if state is None:
+            return None
+        return f"{state.epoch}-{state.seq}"
+
+    def _snapshot_frame(self, state: _LocationState) -> str:
+        # Encoded once per seq: full-frame clients get it on every update
+        if state.frame is None:
+            state.frame = encode_frame({'type': SNAPSHOT, 'seq': state.seq, **unflatten(state.values)})
+        return state.frame
+
+    def drop(self, location_key: str) -> None:
+        self._locations.pop(location_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "locations": len(self._locations),
+            "snapshots": self.snapshots,
+            "deltas": self.deltas_sent,
+            "skipped": self.skipped,
+        }
+
+
+def create_delta_encoder() -> DeltaEncoder:
+    """Encoder configured from settings"""
+    return DeltaEncoder(
+        rel_tol=settings.WS_CHANGE_REL_TOLERANCE,
+        abs_tol=settings.WS_CHANGE_ABS_TOLERANCE,
+        deltas=settings.WS_DELTA_UPDATES,
+    )
@@ -0,0 +1,20 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+ENCODER = "orjson" if orjson is not None else "json"
+
+
+def encode_frame(message: Any) -> str:
+    """
+    Encode a message once into the text of a WebSocket frame, so a
+    broadcast can hand the same frame to every subscriber instead of
+    each `send_json` serialising the dict again.
+    """
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
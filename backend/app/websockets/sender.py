@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import WebSocket, status
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+
+class SenderMetrics:
+    """Aggregate queue counters across every connection in the worker"""
+
+    def __init__(self):
+        self.connections = 0
+        self.queued = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "queued": self.queued,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+        }
+
+
+sender_metrics = SenderMetrics()
+
+
+class ConnectionSender:
+    """
+    Bounded outbound queue for one WebSocket, drained by its own writer
+    task, so a slow or stalled client only ever delays itself. When the
+    queue is full the policy decides what happens:
+
+    - drop_oldest: discard the oldest queued message
+    - coalesce: discard everything queued and keep only the newest
+    - disconnect: close the connection as a slow consumer
+
+    Messages are pre-encoded frames (see `encode_frame`), sent as text.
+    A send that takes longer than `send_timeout` counts as a failure.
+    `on_close` is called once the writer gives up on the connection.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int = 16,
+        policy: str = DROP_OLDEST,
+        send_timeout: float = 10.0,
+        on_close: Optional[Callable[[], None]] = None,
+        metrics: SenderMetrics = sender_metrics,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        if max_queue <= 0:
+            raise ValueError("max_queue must be positive")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self.metrics = metrics
+        self._queue: Deque[str] = deque()
+        self._wakeup = asyncio.Event()
+        self._slow = False
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self) -> None:
+        if self._task is None:
+            self.metrics.connections += 1
+            self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, frame: str, event_id: Optional[str] = None) -> bool:
+        """
+        Queue an encoded frame without waiting; returns False if it was not
+        accepted. `event_id` is only used by transports that label messages (SSE).
+        """
+        if self._closed or self._slow:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.policy == DISCONNECT:
+                self._slow = True
+                self.metrics.slow_disconnects += 1
+                self._wakeup.set()
+                return False
+            if self.policy == COALESCE:
+                dropped = len(self._queue)
+                self._queue.clear()
+            else:
+                dropped = 1
+                self._queue.popleft()
+            self.dropped += dropped
+            self.metrics.dropped += dropped
+            self.metrics.queued -= dropped
+        self._queue.append(frame)
+        self.metrics.queued += 1
+        self.metrics.max_depth = max(self.metrics.max_depth, len(self._queue))
+        self._wakeup.set()
+        return True
+
+    async def _writer(self) -> None:
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self._slow:
+                    logger.info("Disconnecting slow WebSocket consumer")
+                    await asyncio.wait_for(
+                        self.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), self.send_timeout
+                    )
+                    return
+                while self._queue:
+                    frame = self._queue.popleft()
+                    self.metrics.queued -= 1
+                    await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+                    self.metrics.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.metrics.send_errors += 1
+            logger.info(f"WebSocket send failed: {e}")
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._task is not None:
+            self.metrics.connections -= 1
+        self.metrics.queued -= len(self._queue)
+        self._queue.clear()
+        if self.on_close is not None:
+            self.on_close()
+
+    def close(self) -> None:
+        """Stop the writer and drop anything still queued (without calling on_close)"""
+        self.on_close = None
+        self._finish()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+def create_sender(websocket: WebSocket, on_close: Optional[Callable[[], None]] = None) -> ConnectionSender:
+    """Sender configured from settings, with its writer already running"""
+    sender = ConnectionSender(
+        websocket,
+        max_queue=settings.WS_SEND_QUEUE_SIZE,
+        policy=settings.WS_SLOW_CONSUMER_POLICY,
+        send_timeout=settings.WS_SEND_TIMEOUT,
+        on_close=on_close,
+    )
+    sender.start()
+    return sender
@@ -0,0 +1,119 @@
+import asyncio
+from collections import deque
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Deque, Optional, Tuple
+
+from app.core.config import settings
+from app.websockets.sender import SenderMetrics, sender_metrics
+
+HEARTBEAT = b": keepalive\n\n"
+
+# Current full state for a stream as (frame, event id), or None if there is none yet
+Resync = Callable[[], Optional[Tuple[str, Optional[str]]]]
+
+
+@lru_cache(maxsize=1024)
+def format_event(frame: str, event_id: Optional[str] = None) -> bytes:
+    """
+    SSE wire format for an encoded frame. A broadcast hands the same frame
+    to every subscriber, so each event is formatted once and then served
+    from the cache.
+    """
+    lines = f"id: {event_id}\ndata: {frame}\n\n" if event_id else f"data: {frame}\n\n"
+    return lines.encode()
+
+
+class SSESender:
+    """
+    Outbound side of one Server-Sent Events stream, interchangeable with a
+    WebSocket `ConnectionSender` in `ConnectionManager`. The response body
+    drains it directly, so there is no writer task per connection.
+
+    When the client falls behind, the oldest events are dropped. That is
+    harmless for full frames, but a delta stream can't skip frames and SSE
+    gives the client no way to ask for a snapshot, so with `resync` set an
+    overflow instead replaces everything queued with the current snapshot.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 16,
+        heartbeat: float = 15.0,
+        metrics: SenderMetrics = sender_metrics,
+        resync: Optional[Resync] = None,
+    ):
+        if max_queue <= 0:
+            raise ValueError("max_queue must be positive")
+        self.heartbeat = heartbeat
+        self.metrics = metrics
+        self.resync = resync
+        self._queue: Deque[bytes] = deque()
+        self.max_queue = max_queue
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+        self.metrics.connections += 1
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def enqueue(self, frame: str, event_id: Optional[str] = None) -> bool:
+        if self._closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            snapshot = self.resync() if self.resync is not None else None
+            if snapshot is not None:
+                # The snapshot already includes `frame`, so it replaces that too
+                self._drop(len(self._queue))
+                frame, event_id = snapshot
+            else:
+                self._drop(1)
+        self._queue.append(format_event(frame, event_id))
+        self.metrics.queued += 1
+        self.metrics.max_depth = max(self.metrics.max_depth, len(self._queue))
+        self._wakeup.set()
+        return True
+
+    def _drop(self, count: int) -> None:
+        for _ in range(count):
+            self._queue.popleft()
+        self.dropped += count
+        self.metrics.dropped += count
+        self.metrics.queued -= count
+
+    async def events(self, retry: Optional[float] = None) -> AsyncIterator[bytes]:
+        """Response body: queued events as they arrive, with heartbeat comments in between"""
+        if retry is not None:
+            yield f"retry: {int(retry * 1000)}\n\n".encode()
+        while not self._closed:
+            if not self._queue:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from timing out an idle stream
+                    yield HEARTBEAT
+                    continue
+            while self._queue:
+                event = self._queue.popleft()
+                self.metrics.queued -= 1
+                self.metrics.sent += 1
+                yield event
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.metrics.connections -= 1
+        self.metrics.queued -= len(self._queue)
+        self._queue.clear()
+        self._wakeup.set()
+
+
+def create_sse_sender() -> SSESender:
+    """Sender configured from settings"""
+    return SSESender(max_queue=settings.WS_SEND_QUEUE_SIZE, heartbeat=settings.SSE_HEARTBEAT_INTERVAL)
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark for the WebSocket broadcast path.
+
+Compares the per-subscriber CPU cost of the old path (every subscriber's
+`send_json` re-encodes the update) against encoding the update once with
+`encode_frame` and handing the same text frame to every subscriber.
+
+    cd backend && python benchmarks/ws_broadcast.py [--subscribers 1 10 100 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.websockets.encoding import ENCODER, encode_frame  # noqa: E402
+
+
+class FakeWebSocket:
+    """Stands in for a Starlette WebSocket; only the encoding work is real"""
+
+    def __init__(self):
+        self.frames = 0
+
+    def send_text(self, data: str):
+        self.frames += 1
+
+    def send_json(self, data):
+        # What Starlette's send_json does before sending the frame
+        self.send_text(json.dumps(data))
+
+
+def sample_update() -> dict:
+    components = {
+        "co": 201.94, "no": 0.02, "no2": 0.77, "o3": 68.66,
+        "so2": 0.64, "pm2_5": 0.5, "pm10": 0.54, "nh3": 0.12,
+    }
+    return {
+        "type": "air_quality_update",
+        "data": {
+            "aqi": 2,
+            "aqi_category": "Good",
+            "dominant_pollutant": "o3",
+            "components": components,
+            "timestamp": datetime.utcnow().isoformat(),
+            "location": {"lat": -1.275, "lon": 36.825},
+            "cell": {"key": "1774:4336", "lat": -1.275, "lon": 36.825},
+        },
+    }
+
+
+def per_client(message: dict, sockets) -> None:
+    for websocket in sockets:
+        websocket.send_json(message)
+
+
+def serialize_once(message: dict, sockets) -> None:
+    frame = encode_frame(message)
+    for websocket in sockets:
+        websocket.send_text(frame)
+
+
+def measure(fn, message: dict, subscribers: int, min_time: float) -> float:
+    """CPU seconds per subscriber per broadcast"""
+    sockets = [FakeWebSocket() for _ in range(subscribers)]
+    rounds = 0
+    start = time.process_time()
+    while True:
+        fn(message, sockets)
+        rounds += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return elapsed / (rounds * subscribers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--min-time", type=float, default=0.5, help="CPU seconds per measurement")
+    args = parser.parse_args()
+
+    message = sample_update()
+    print(f"encoder: {ENCODER}, frame size: {len(encode_frame(message))} bytes")
+    print(f"{'subscribers':>11}  {'per-client us':>13}  {'once us':>9}  {'speedup':>7}")
+    for subscribers in args.subscribers:
+        old = measure(per_client, message, subscribers, args.min_time)
+        new = measure(serialize_once, message, subscribers, args.min_time)
+        print(f"{subscribers:>11}  {old * 1e6:>13.2f}  {new * 1e6:>9.2f}  {old / new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
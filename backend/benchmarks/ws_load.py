@@ -0,0 +1,340 @@
+"""
+Load test for /api/v1/ws/air-quality with thousands of subscribers.
+
+Runs the app in-process under uvicorn with the fake air-quality provider,
+then opens N authenticated sockets from separate client processes and
+subscribes them to a spread of locations. Nothing external is needed:
+no OpenWeatherMap key and no database (WebSocket auth only checks the JWT).
+
+Reports:
+- connect latency (TCP + WebSocket handshake) percentiles
+- update delivery latency (server timestamp -> client receive, on deltas)
+- server RSS growth per open connection
+- server event-loop lag
+- the app's own /api/v1/metrics counters at the end of the run
+
+    cd backend && python benchmarks/ws_load.py --clients 2000 --locations 200 --duration 60
+
+Clients run in their own processes so their CPU and memory don't pollute
+the server's numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_CENTER = (-1.286, 36.817)  # Nairobi
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": ordered[-1]}
+
+
+def format_ms(stats: Dict[str, Optional[float]]) -> str:
+    if not stats["count"]:
+        return "no samples"
+    return "n={count}  p50={p50:.1f}ms  p90={p90:.1f}ms  p99={p99:.1f}ms  max={max:.1f}ms".format(
+        count=stats["count"], **{k: stats[k] * 1000 for k in ("p50", "p90", "p99", "max")}
+    )
+
+
+def raise_fd_limit() -> None:
+    # Every socket is a file descriptor; the default soft limit is often 1024
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except ValueError:
+            pass
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+# --- Client side -------------------------------------------------------------
+
+def pick_locations(args: argparse.Namespace) -> List[tuple]:
+    """Location centres and the weight of each under the chosen distribution"""
+    rng = random.Random(args.seed)
+    lat0, lon0 = args.center
+    centres = [
+        (lat0 + rng.uniform(-args.spread, args.spread), lon0 + rng.uniform(-args.spread, args.spread))
+        for _ in range(args.locations)
+    ]
+    if args.distribution == "zipf":
+        weights = [1 / (rank + 1) ** args.zipf_s for rank in range(args.locations)]
+    else:
+        weights = [1.0] * args.locations
+    return list(zip(centres, weights))
+
+
+def delta_timestamp(frame: Dict[str, Any]) -> Optional[str]:
+    # Only deltas are fresh broadcasts; snapshots to late joiners carry the
+    # time of an earlier update
+    if frame.get("type") == "air_quality_delta":
+        return (frame.get("changes") or {}).get("data.timestamp")
+    return None
+
+
+class ClientStats:
+    def __init__(self):
+        self.connect_latency: List[float] = []
+        self.delivery_latency: List[float] = []
+        self.frames: Dict[str, int] = {}
+        self.connect_errors = 0
+        self.disconnects = 0
+        self.seq_gaps = 0
+
+
+async def run_client(websockets, url: str, location: tuple, stats: ClientStats, stop: asyncio.Event):
+    started = time.perf_counter()
+    try:
+        ws = await websockets.connect(url, open_timeout=30, max_queue=None)
+    except Exception:
+        stats.connect_errors += 1
+        return
+    stats.connect_latency.append(time.perf_counter() - started)
+    last_seq = None
+    try:
+        await ws.send(json.dumps({"latitude": location[0], "longitude": location[1]}))
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            received = time.time()
+            frame = json.loads(raw)
+            kind = frame.get("type", "unknown")
+            stats.frames[kind] = stats.frames.get(kind, 0) + 1
+
+            seq = frame.get("seq")
+            if kind == "air_quality_delta" and last_seq is not None and seq != last_seq + 1:
+                # Same recovery a real client would do
+                stats.seq_gaps += 1
+                await ws.send(json.dumps({"type": "snapshot"}))
+            if seq is not None:
+                last_seq = seq
+
+            timestamp = delta_timestamp(frame)
+            if timestamp:
+                stats.delivery_latency.append(received - datetime.fromisoformat(timestamp).timestamp())
+    except websockets.exceptions.ConnectionClosed:
+        stats.disconnects += 1
+    finally:
+        await ws.close()
+
+
+async def client_main(args: argparse.Namespace) -> None:
+    import websockets
+
+    raise_fd_limit()
+    locations = pick_locations(args)
+    rng = random.Random(args.seed + args.worker)
+    chosen = rng.choices([loc for loc, _ in locations], weights=[w for _, w in locations], k=args.count)
+    url = f"ws://{args.host}:{args.port}/api/v1/ws/air-quality?token={args.token}&deltas=1"
+
+    stats = ClientStats()
+    stop = asyncio.Event()
+    tasks = []
+    delay = 1 / args.connect_rate if args.connect_rate else 0
+    for location in chosen:
+        tasks.append(asyncio.create_task(run_client(websockets, url, location, stats, stop)))
+        if delay:
+            await asyncio.sleep(delay)
+
+    # Wait until every socket is open (or has failed) before the server measures memory
+    while len(stats.connect_latency) + stats.connect_errors < args.count:
+        await asyncio.sleep(0.1)
+    print(json.dumps({"event": "connected", "connected": len(stats.connect_latency)}), flush=True)
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(json.dumps({
+        "event": "done",
+        "connect_latency": stats.connect_latency,
+        "delivery_latency": stats.delivery_latency,
+        "frames": stats.frames,
+        "connect_errors": stats.connect_errors,
+        "disconnects": stats.disconnects,
+        "seq_gaps": stats.seq_gaps,
+    }), flush=True)
+
+
+# --- Server side -------------------------------------------------------------
+
+def configure_app_env(args: argparse.Namespace) -> None:
+    """Settings are read at import time, so this must run before importing app"""
+    defaults = {
+        "AIR_QUALITY_PROVIDER": "fake",
+        "AIR_QUALITY_FAKE_LATENCY_MS": str(args.upstream_latency_ms),
+        "AIR_QUALITY_FAKE_SEED": str(args.seed),
+        "WS_UPDATE_INTERVAL": str(args.update_interval),
+        # Short TTL and a generous quota so every tick reaches the fake upstream
+        "AIR_QUALITY_CACHE_TTL": str(max(args.update_interval / 2, 0.5)),
+        "AIR_QUALITY_RATE_LIMIT_PER_SECOND": "10000",
+        "AIR_QUALITY_RATE_LIMIT_BURST": "10000",
+        # Fixed intervals, so update counts are comparable between runs
+        "WS_MIN_INTERVAL": str(args.update_interval),
+        "WS_MAX_INTERVAL": str(args.update_interval),
+        "WS_REFRESH_BUDGET_PER_MINUTE": "0",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+async def monitor_loop_lag(samples: List[float], interval: float = 0.05) -> None:
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def read_events(proc: asyncio.subprocess.Process, connected: asyncio.Queue) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    while True:
+        line = await proc.stdout.readline()
+        if not line:
+            break
+        event = json.loads(line)
+        if event["event"] == "connected":
+            await connected.put(event["connected"])
+        elif event["event"] == "done":
+            result = event
+    await proc.wait()
+    return result
+
+
+async def server_main(args: argparse.Namespace) -> None:
+    configure_app_env(args)
+    raise_fd_limit()
+
+    import uvicorn
+    from app.core.security import create_access_token
+    from app.main import app, metrics
+
+    config = uvicorn.Config(app, host=args.host, port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    lag_samples: List[float] = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+    await asyncio.sleep(1.0)
+    baseline_rss = rss_bytes()
+
+    token = create_access_token("loadtest@example.com")
+    per_process = [args.clients // args.processes + (i < args.clients % args.processes) for i in range(args.processes)]
+    connected: asyncio.Queue = asyncio.Queue()
+    procs = []
+    started = time.perf_counter()
+    for worker, count in enumerate(per_process):
+        procs.append(await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--role", "clients",
+            "--worker", str(worker), "--count", str(count), "--token", token,
+            *forwarded_args(args),
+            stdout=asyncio.subprocess.PIPE,
+        ))
+    readers = [asyncio.create_task(read_events(proc, connected)) for proc in procs]
+
+    total_connected = 0
+    for _ in procs:
+        total_connected += await connected.get()
+    ramp = time.perf_counter() - started
+    connected_rss = rss_bytes()
+    lag_before = len(lag_samples)
+    print(f"{total_connected}/{args.clients} sockets open after {ramp:.1f}s, holding for {args.duration:.0f}s")
+
+    results = await asyncio.gather(*readers)
+    lag_task.cancel()
+    app_metrics = json.loads(metrics().body)
+    server.should_exit = True
+    await serve_task
+
+    connect_latency = [v for r in results for v in r.get("connect_latency", ())]
+    delivery_latency = [v for r in results for v in r.get("delivery_latency", ())]
+    frames: Dict[str, int] = {}
+    for r in results:
+        for kind, count in r.get("frames", {}).items():
+            frames[kind] = frames.get(kind, 0) + count
+
+    print()
+    print(f"clients:          {args.clients} over {args.locations} locations ({args.distribution})")
+    print(f"connect errors:   {sum(r.get('connect_errors', 0) for r in results)}")
+    print(f"server closed:    {sum(r.get('disconnects', 0) for r in results)}")
+    print(f"seq gaps:         {sum(r.get('seq_gaps', 0) for r in results)}")
+    print(f"frames:           {frames}")
+    print(f"connect latency:  {format_ms(percentiles(connect_latency))}")
+    print(f"delivery latency: {format_ms(percentiles(delivery_latency))}")
+    if total_connected:
+        per_connection = (connected_rss - baseline_rss) / total_connected
+        print(f"server RSS:       {baseline_rss / 2**20:.1f} MiB -> {connected_rss / 2**20:.1f} MiB "
+              f"({per_connection / 1024:.1f} KiB per connection)")
+    print(f"loop lag (ramp):  {format_ms(percentiles(lag_samples[:lag_before]))}")
+    print(f"loop lag (hold):  {format_ms(percentiles(lag_samples[lag_before:]))}")
+    print()
+    print(json.dumps(app_metrics, indent=2))
+
+
+def forwarded_args(args: argparse.Namespace) -> List[str]:
+    return [
+        "--host", args.host, "--port", str(args.port),
+        "--locations", str(args.locations), "--distribution", args.distribution,
+        "--zipf-s", str(args.zipf_s), "--center", str(args.center[0]), str(args.center[1]),
+        "--spread", str(args.spread), "--duration", str(args.duration),
+        "--connect-rate", str(args.connect_rate), "--seed", str(args.seed),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=2, help="client processes")
+    parser.add_argument("--locations", type=int, default=100)
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="zipf")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="zipf exponent")
+    parser.add_argument("--center", type=float, nargs=2, default=DEFAULT_CENTER, metavar=("LAT", "LON"))
+    parser.add_argument("--spread", type=float, default=2.0, help="+/- degrees around the center")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to hold all sockets open")
+    parser.add_argument("--connect-rate", type=float, default=500.0, help="new sockets per second per process (0 = all at once)")
+    parser.add_argument("--update-interval", type=float, default=5.0, help="WS_UPDATE_INTERVAL for the run")
+    parser.add_argument("--upstream-latency-ms", type=float, default=150.0, help="fake provider median latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    # Internal: client worker processes
+    parser.add_argument("--role", choices=("server", "clients"), default="server", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--token", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "clients":
+        asyncio.run(client_main(args))
+    else:
+        asyncio.run(server_main(args))
+
+
+if __name__ == "__main__":
+    main()